@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from functools import lru_cache
 import streamlit as st
 
 @dataclass(frozen=True)
@@ -9,6 +10,7 @@ class Settings:
     cache_ttl_static_seconds: int = 60 * 60 * 24      # 24h
     cache_ttl_price_seconds: int = 60                 # 60s
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     # Streamlit secrets recomendado (Streamlit Cloud)
     # st.secrets["RAPIDAPI_KEY"], st.secrets["RAPIDAPI_HOST"]
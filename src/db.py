@@ -136,9 +136,21 @@ def get_conn() -> sqlite3.Connection:
         conn.execute("PRAGMA foreign_keys=ON;")
         conn.execute("PRAGMA temp_store=MEMORY;")
         conn.execute("PRAGMA busy_timeout=30000;")  # 30s
+        # Lecturas calientes del caché desde memoria: mmap del archivo (256 MB de
+        # espacio virtual, no RAM reservada) + page cache de 64 MB por conexión
+        conn.execute("PRAGMA mmap_size=268435456;")
+        conn.execute("PRAGMA cache_size=-65536;")
     except Exception:
         pass
 
+    ensure_schema(conn)
+    return conn
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """
+    Único lugar donde se define (y migra) el esquema SQLite.
+    """
     # Tabla cache legacy (si alguna parte la usa)
     conn.execute(
         """
@@ -157,13 +169,17 @@ def get_conn() -> sqlite3.Connection:
             key TEXT PRIMARY KEY,
             value_json TEXT NOT NULL,
             created_at INTEGER NOT NULL,
-            ttl_seconds INTEGER
+            ttl_seconds INTEGER,
+            compute_ms INTEGER
         )
         """
     )
+    # Migración: DBs creadas antes de compute_ms
+    cols = {r["name"] for r in conn.execute("PRAGMA table_info(kv_cache)").fetchall()}
+    if "compute_ms" not in cols:
+        conn.execute("ALTER TABLE kv_cache ADD COLUMN compute_ms INTEGER")
 
     conn.commit()
-    return conn
 
 
 def init_db() -> None:
@@ -2,12 +2,7 @@
 import streamlit as st
 
 from src.services.usage_limits import remaining_searches, consume_search
-from src.services.finance_data import (
-    get_price_data,
-    get_profile_data,
-    get_key_stats,
-    get_dividend_kpis,   # ✅ NUEVO
-)
+from src.services.finance_data import get_static_data
 from src.services.logos import logo_candidates
 from src.auth import logout_button
 from src.services.cache_store import cache_clear_all
@@ -33,11 +28,15 @@ def _is_admin() -> bool:
     return _get_user_role() == "admin" or st.session_state.get("is_admin") is True
 
 
+# 1,234.56 -> 1.234,56 en una sola pasada (en vez de 3 replace)
+_ES_NUMBER = str.maketrans({",": ".", ".": ","})
+
+
 def _fmt_price(x, currency: str) -> str:
     if not isinstance(x, (int, float)):
         return "N/D"
     # 1.234,56 estilo ES
-    s = f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    s = f"{x:,.2f}".translate(_ES_NUMBER)
     return f"{s} {currency}".strip()
 
 
@@ -138,20 +137,20 @@ def page_analysis():
         # -----------------------------
         # DATA
         # -----------------------------
-        price = get_price_data(ticker) or {}
-        profile = get_profile_data(ticker) or {}
-        raw = profile.get("raw") if isinstance(profile, dict) else {}
-        stats = get_key_stats(ticker) or {}
-        divk = get_dividend_kpis(ticker) or {}  # ✅ NUEVO (cacheado)
+        data = get_static_data(ticker)
+        price = data["price"]
+        profile = data["profile"]
+        stats = data["stats"]
+        divk = data["dividends"]  # ✅ cacheado
 
-        company_name = raw.get("longName") or raw.get("shortName") or profile.get("shortName") or ticker
+        company_name = profile.get("longName") or profile.get("shortName") or ticker
 
         last_price = price.get("last_price")
         currency = price.get("currency") or ""
         delta_txt, pct_val = _fmt_delta(price.get("net_change"), price.get("pct_change"))
 
         # Logo (best effort)
-        website = (profile.get("website") or raw.get("website") or "") if isinstance(profile, dict) else ""
+        website = profile.get("website") or ""
         logos = logo_candidates(website) if website else []
         logo_url = next((u for u in logos if isinstance(u, str) and u.startswith(("http://", "https://"))), "")
 
@@ -1,100 +1,334 @@
 # src/services/cache_store.py
 import json
+import sqlite3
+import sys
+import threading
 import time
-from typing import Any, Optional
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Union
 
 from src.db import get_conn
 
+try:
+    import orjson
+except Exception:
+    orjson = None  # type: ignore
 
-def _ensure_cache_table() -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS kv_cache (
-            key TEXT PRIMARY KEY,
-            value_json TEXT NOT NULL,
-            created_at INTEGER NOT NULL,
-            ttl_seconds INTEGER
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
+_ORJSON_OPTS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
 
 
-def cache_get(key: str) -> Optional[Any]:
-    _ensure_cache_table()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT value_json, created_at, ttl_seconds FROM kv_cache WHERE key = ?",
-        (key,),
-    )
-    row = cur.fetchone()
-    conn.close()
+def _dumps(value: Any) -> str:
+    """JSON del valor: orjson (C, UTF-8) si está; json stdlib si no o si orjson rechaza algo."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=_ORJSON_OPTS).decode("utf-8")
+        except Exception:
+            pass
+    return json.dumps(value, ensure_ascii=False)
 
-    if not row:
-        return None
 
+def _loads(raw: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except Exception:
+            pass
+    # json stdlib acepta NaN/Infinity de filas escritas antes de orjson
+    return json.loads(raw)
+
+
+# Memo en proceso de valores ya decodificados: key -> (created_at, digest, valor), con
+# digest = hash del value_json crudo (cambia en toda escritura con otro contenido,
+# aunque caiga en el mismo segundo y con el mismo largo). Hashear el blob es mucho
+# más barato que json.loads (caro en blobs grandes como SEC).
+# OJO: el valor se comparte entre llamadas → tratarlo como solo-lectura.
+_DECODED_MAX_ITEMS = 256
+_DECODED: "OrderedDict[str, tuple[int, int, Any]]" = OrderedDict()
+_DECODED_LOCK = threading.Lock()
+
+# Payloads chicos (perfiles, quotes) repiten muchos strings entre tickers
+# ("USD", "Technology", "buy", claves de yfinance...) → se internan al memoizar.
+_INTERN_MAX_BYTES = 64 * 1024
+_INTERN_MAX_LEN = 64
+
+# Valores grandes (companyfacts SEC, info de yfinance) se guardan comprimidos con zlib
+# como BLOB en la misma columna: ~5-10x menos bytes leídos de SQLite por hit.
+# Las filas TEXT existentes se siguen leyendo igual.
+_COMPRESS_MIN_BYTES = 16 * 1024
+_COMPRESS_LEVEL = 1
+
+# Sube cada vez que se limpia el caché (permite invalidar memos en otras capas)
+_GENERATION = 0
+
+
+def cache_generation() -> int:
+    return _GENERATION
+
+
+def _intern_strings(x: Any) -> Any:
+    if isinstance(x, str):
+        return sys.intern(x) if len(x) < _INTERN_MAX_LEN else x
+    if isinstance(x, dict):
+        return {sys.intern(k): _intern_strings(v) for k, v in x.items()}
+    if isinstance(x, list):
+        return [_intern_strings(v) for v in x]
+    return x
+
+
+def _decoded_get(key: str, created_at: int, digest: int) -> tuple[bool, Any]:
+    with _DECODED_LOCK:
+        hit = _DECODED.get(key)
+        if hit is None or hit[0] != created_at or hit[1] != digest:
+            return (False, None)
+        _DECODED.move_to_end(key)
+        return (True, hit[2])
+
+
+def _decoded_put(key: str, created_at: int, digest: int, value: Any) -> None:
+    with _DECODED_LOCK:
+        _DECODED[key] = (created_at, digest, value)
+        _DECODED.move_to_end(key)
+        while len(_DECODED) > _DECODED_MAX_ITEMS:
+            _DECODED.popitem(last=False)
+
+
+def _decoded_forget(key: Optional[str] = None, prefix: Optional[str] = None) -> None:
+    with _DECODED_LOCK:
+        if key is not None:
+            _DECODED.pop(key, None)
+        elif prefix:
+            for k in [k for k in _DECODED if k.startswith(prefix)]:
+                del _DECODED[k]
+        else:
+            _DECODED.clear()
+
+
+# Una conexión SQLite persistente por proceso (check_same_thread=False en get_conn),
+# serializada con un lock: evita abrir conexión + PRAGMAs + CREATE TABLE en cada
+# lectura y aprovecha el statement cache de sqlite3. El esquema (src/db.ensure_schema)
+# se verifica una sola vez, al abrirla.
+_CONN: Optional[sqlite3.Connection] = None
+_CONN_LOCK = threading.RLock()
+
+
+@contextmanager
+def _conn() -> Iterator[sqlite3.Connection]:
+    global _CONN
+    with _CONN_LOCK:
+        if _CONN is None:
+            _CONN = get_conn()
+        try:
+            yield _CONN
+        except sqlite3.Error:
+            # Conexión en mal estado (p.ej. DB reemplazada): se reabre en la próxima
+            try:
+                _CONN.close()
+            except Exception:
+                pass
+            _CONN = None
+            raise
+
+
+def _decode_row(key: str, row: Any) -> Optional[dict]:
     created_at = int(row["created_at"])
     ttl = row["ttl_seconds"]
-    if ttl is not None:
-        ttl = int(ttl)
-        if (int(time.time()) - created_at) > ttl:
-            # expirado → borrar y retornar None
-            cache_delete(key)
-            return None
+    compute_ms = row["compute_ms"]
+    meta = {
+        "created_at": created_at,
+        "ttl_seconds": int(ttl) if ttl is not None else None,
+        "compute_ms": int(compute_ms) if compute_ms is not None else None,
+    }
+
+    raw = row["value_json"]
+    digest = hash(raw)
+    found, value = _decoded_get(key, created_at, digest)
+    if found:
+        return {"value": value, **meta}
 
     try:
-        return json.loads(row["value_json"])
+        if isinstance(raw, bytes):
+            raw = zlib.decompress(raw)
+        value = _loads(raw)
     except Exception:
         return None
+    if len(raw) <= _INTERN_MAX_BYTES:
+        value = _intern_strings(value)
+    _decoded_put(key, created_at, digest, value)
+    return {"value": value, **meta}
+
+
+def _read_row(key: str) -> Optional[dict]:
+    """
+    Lee la fila tal cual (aunque esté expirada) y decodifica el valor (con memo).
+    Retorna {"value", "created_at", "ttl_seconds", "compute_ms"} o None.
+    """
+    with _conn() as conn:
+        row = conn.execute(
+            "SELECT value_json, created_at, ttl_seconds, compute_ms FROM kv_cache WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+    if not row:
+        return None
+    return _decode_row(key, row)
+
+
+def cache_get(key: str) -> Optional[Any]:
+    entry = _read_row(key)
+    if entry is None:
+        return None
+
+    ttl = entry["ttl_seconds"]
+    if ttl is not None and (int(time.time()) - entry["created_at"]) > ttl:
+        # expirado → borrar y retornar None
+        cache_delete(key)
+        return None
+    return entry["value"]
+
+
+def cache_get_entry(key: str) -> Optional[dict]:
+    """
+    Como cache_get, pero NO descarta filas expiradas y agrega metadatos:
+    {"value", "age", "ttl_seconds", "compute_ms"}. El caller decide la frescura.
+    """
+    entry = _read_row(key)
+    if entry is None:
+        return None
+    entry["age"] = int(time.time()) - entry.pop("created_at")
+    return entry
+
+
+# SQLite limita los parámetros por statement (999 en builds viejos)
+_MGET_CHUNK = 500
+
+
+def cache_mget(keys: list[str]) -> dict[str, dict]:
+    """
+    cache_get_entry para varias keys con un SELECT ... IN por lote.
+    Retorna {key: {"value", "age", "ttl_seconds", "compute_ms"}} solo para las keys
+    presentes; no descarta expiradas (el caller decide la frescura).
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    rows = []
+    with _conn() as conn:
+        for i in range(0, len(keys), _MGET_CHUNK):
+            chunk = keys[i:i + _MGET_CHUNK]
+            rows.extend(conn.execute(
+                "SELECT key, value_json, created_at, ttl_seconds, compute_ms FROM kv_cache "
+                f"WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall())
+
+    now = int(time.time())
+    out: dict[str, dict] = {}
+    for row in rows:
+        k = row["key"]
+        entry = _decode_row(k, row)
+        if entry is None:
+            continue
+        entry["age"] = now - entry.pop("created_at")
+        out[k] = entry
+    return out
+
+
+def cache_set(
+    key: str,
+    value: Any,
+    ttl_seconds: Optional[int] = None,
+    compute_ms: Optional[int] = None,
+    value_json: Optional[str] = None,
+) -> None:
+    """
+    value_json: JSON ya serializado de value (si el caller ya lo tiene, p.ej. tras
+    sanitizar con orjson) → se guarda tal cual sin volver a encodear.
+    """
+    _decoded_forget(key)
+    payload: Any = value_json if value_json is not None else _dumps(value)
+    if len(payload) >= _COMPRESS_MIN_BYTES:
+        payload = zlib.compress(payload.encode("utf-8"), _COMPRESS_LEVEL)
+    with _conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO kv_cache(key, value_json, created_at, ttl_seconds, compute_ms)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value_json=excluded.value_json,
+                created_at=excluded.created_at,
+                ttl_seconds=excluded.ttl_seconds,
+                compute_ms=excluded.compute_ms
+            """,
+            (
+                key,
+                payload,
+                int(time.time()),
+                int(ttl_seconds) if ttl_seconds is not None else None,
+                int(compute_ms) if compute_ms is not None else None,
+            ),
+        )
+        conn.commit()
 
 
-def cache_set(key: str, value: Any, ttl_seconds: Optional[int] = None) -> None:
-    _ensure_cache_table()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO kv_cache(key, value_json, created_at, ttl_seconds)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(key) DO UPDATE SET
-            value_json=excluded.value_json,
-            created_at=excluded.created_at,
-            ttl_seconds=excluded.ttl_seconds
-        """,
-        (
-            key,
-            json.dumps(value, ensure_ascii=False),
-            int(time.time()),
-            int(ttl_seconds) if ttl_seconds is not None else None,
-        ),
-    )
-    conn.commit()
-    conn.close()
+def cache_incr(
+    key: str,
+    delta: int = 1,
+    ttl_seconds: Optional[int] = None,
+    max_value: Optional[int] = None,
+) -> tuple[bool, int]:
+    """
+    Contador atómico: suma delta en un solo UPSERT ... RETURNING (sin get + set,
+    que entre sesiones concurrentes pierde incrementos o se pasa del límite).
+    Una fila vencida cuenta como 0 y reinicia su TTL desde ahora.
+    Con max_value, si el resultado lo supera se hace rollback.
+    Retorna (aplicado, valor_actual).
+    """
+    _decoded_forget(key)
+    now = int(time.time())
+    expired = "(kv_cache.ttl_seconds IS NOT NULL AND kv_cache.created_at + kv_cache.ttl_seconds < excluded.created_at)"
+    with _conn() as conn:
+        row = conn.execute(
+            f"""
+            INSERT INTO kv_cache(key, value_json, created_at, ttl_seconds, compute_ms)
+            VALUES (?, CAST(? AS TEXT), ?, ?, NULL)
+            ON CONFLICT(key) DO UPDATE SET
+                value_json=CAST(
+                    (CASE WHEN {expired} THEN 0 ELSE CAST(kv_cache.value_json AS INTEGER) END) + ?
+                    AS TEXT
+                ),
+                created_at=CASE WHEN {expired} THEN excluded.created_at ELSE kv_cache.created_at END,
+                ttl_seconds=excluded.ttl_seconds
+            RETURNING CAST(value_json AS INTEGER)
+            """,
+            (key, int(delta), now, int(ttl_seconds) if ttl_seconds is not None else None, int(delta)),
+        ).fetchone()
+        value = int(row[0])
+        if max_value is not None and value > max_value:
+            conn.rollback()
+            return False, value - int(delta)
+        conn.commit()
+    return True, value
 
 
 def cache_delete(key: str) -> None:
-    _ensure_cache_table()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM kv_cache WHERE key = ?", (key,))
-    conn.commit()
-    conn.close()
+    _decoded_forget(key)
+    with _conn() as conn:
+        conn.execute("DELETE FROM kv_cache WHERE key = ?", (key,))
+        conn.commit()
 
 
 def cache_clear(prefix: Optional[str] = None) -> None:
-    _ensure_cache_table()
-    conn = get_conn()
-    cur = conn.cursor()
-    if prefix:
-        cur.execute("DELETE FROM kv_cache WHERE key LIKE ?", (f"{prefix}%",))
-    else:
-        cur.execute("DELETE FROM kv_cache")
-    conn.commit()
-    conn.close()
+    global _GENERATION
+    _decoded_forget(prefix=prefix)
+    _GENERATION += 1
+    with _conn() as conn:
+        if prefix:
+            conn.execute("DELETE FROM kv_cache WHERE key LIKE ?", (f"{prefix}%",))
+        else:
+            conn.execute("DELETE FROM kv_cache")
+        conn.commit()
 
 # --- Backward compatible alias (do not remove) ---
 def cache_clear_all() -> None:
@@ -1,14 +1,31 @@
 # src/services/finance_data.py
 from __future__ import annotations
 
-from datetime import datetime, date
+import atexit
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, date, timezone
+from zoneinfo import ZoneInfo
+from functools import lru_cache
 from typing import Any, Callable
 
 import pandas as pd
 import numpy as np
+import yfinance as yf
 
-from src.services.cache_store import cache_get, cache_set
-from src.services.yf_client import install_http_cache, yf_call
+try:
+    import orjson
+except Exception:
+    orjson = None  # type: ignore
+
+from src.services.cache_store import cache_generation, cache_get_entry, cache_mget, cache_set
+from src.services.yf_client import install_http_cache, yf_batch_history, yf_call_dedup
 
 # ✅ NUEVO: SEC fundamentals (sin romper la fachada)
 from src.services.sec_data import get_fundamentals_minimal
@@ -20,45 +37,332 @@ class FinanceDataError(RuntimeError):
 install_http_cache(expire_seconds=3600)
 
 
+_ORJSON_OPTS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+_SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+
+# Clases numpy resueltas una vez (sin LOAD_ATTR sobre np en cada valor)
+_NP_INT = np.integer
+_NP_FLOAT = np.floating
+_NP_BOOL = np.bool_
+
+
+def _ident(x: Any) -> Any:
+    return x
+
+
+# Despacho por tipo exacto (un dict lookup) antes de la cadena de isinstance
+_SAFE_DISPATCH: dict[type, Callable[[Any], Any]] = {tp: _ident for tp in _SCALAR_TYPES}
+
+
 def _json_safe(x: Any) -> Any:
-    """Convierte objetos a tipos JSON serializables."""
-    if x is None:
-        return None
+    """
+    Convierte objetos a tipos JSON serializables.
+    Fast path: orjson recorre el árbol en C (numpy/datetime nativos); solo los tipos
+    raros caen al default (_json_safe_py). Sin orjson, el encoder C de json (stdlib)
+    hace lo mismo. Si ambos fallan (p.ej. keys no serializables), versión Python.
+    """
+    if type(x) in _SCALAR_TYPES:
+        return x
+    try:
+        if orjson is not None:
+            return orjson.loads(orjson.dumps(x, default=_json_safe_py, option=_ORJSON_OPTS))
+        return json.loads(json.dumps(x, default=_json_safe_py))
+    except Exception:
+        pass
+    return _json_safe_py(x)
+
+
+def _safe_dict(x: Any) -> dict:
+    return {str(k): _json_safe_py(v) for k, v in x.items()}
+
+
+def _safe_list(x: Any) -> list:
+    return [_json_safe_py(v) for v in x]
+
+
+def _iso(x: Any) -> str:
+    return x.isoformat()
+
+
+def _json_safe_dump(x: Any) -> tuple[Any, str | None]:
+    """
+    Como _json_safe, pero con orjson devuelve también el JSON ya encodeado, para que
+    cache_set lo guarde sin serializar dos veces. (valor, None) si no hay orjson.
+    """
+    if orjson is not None:
+        try:
+            raw = orjson.dumps(x, default=_json_safe_py, option=_ORJSON_OPTS)
+            return orjson.loads(raw), raw.decode("utf-8")
+        except Exception:
+            pass
+    return _json_safe(x), None
+
+
+def _json_safe_py(x: Any) -> Any:
+    """
+    Versión Python (recursiva) de _json_safe.
+    Los tipos comunes (escalares, contenedores, fechas, escalares numpy) se resuelven
+    con un solo lookup por tipo exacto; la cadena de isinstance queda para subclases.
+    """
+    h = _SAFE_DISPATCH.get(type(x))
+    if h is not None:
+        return h(x)
+    if isinstance(x, dict):
+        return _safe_dict(x)
+    if isinstance(x, (list, tuple, set)):
+        return _safe_list(x)
+    # Subclases de escalares (p.ej. enums str)
     if isinstance(x, (str, int, float, bool)):
         return x
     if isinstance(x, (datetime, date)):
         return x.isoformat()
-    if isinstance(x, dict):
-        return {str(k): _json_safe(v) for k, v in x.items()}
-    if isinstance(x, (list, tuple, set)):
-        return [_json_safe(v) for v in x]
     # Pandas/numpy scalars
-    try:
-        if isinstance(x, np.integer):
-            return int(x)
-        if isinstance(x, np.floating):
-            return float(x)
-        if isinstance(x, np.bool_):
-            return bool(x)
-    except Exception:
-        pass
+    if isinstance(x, _NP_INT):
+        return int(x)
+    if isinstance(x, _NP_FLOAT):
+        return float(x)
+    if isinstance(x, _NP_BOOL):
+        return bool(x)
     # Object with items
     try:
         if hasattr(x, "items"):
-            return {str(k): _json_safe(v) for k, v in dict(x).items()}
+            return {str(k): _json_safe_py(v) for k, v in dict(x).items()}
     except Exception:
         pass
     return str(x)
 
 
-def _cache_get_or_set(key: str, ttl: int, fn: Callable[[], Any]):
-    hit = cache_get(key)
+_SAFE_DISPATCH.update({
+    dict: _safe_dict,
+    list: _safe_list,
+    tuple: _safe_list,
+    set: _safe_list,
+    datetime: _iso,
+    date: _iso,
+    np.bool_: bool,
+    np.int64: int,
+    np.int32: int,
+    np.float64: float,
+    np.float32: float,
+})
+
+
+# Tier en memoria (por proceso) delante de SQLite: llamadas repetidas dentro de
+# unos segundos (misma página / rerun) no tocan disco ni decodifican JSON.
+# Se invalida solo por tiempo (máx 60s) o si alguien limpia el caché (generation).
+_MEM_MAX_ITEMS = 1024
+_MEM_MAX_TTL = 60
+_MEM: "OrderedDict[str, tuple[float, int, Any]]" = OrderedDict()
+_MEM_LOCK = threading.Lock()
+
+
+def _mem_get(key: str) -> Any:
+    now = time.monotonic()
+    with _MEM_LOCK:
+        e = _MEM.get(key)
+        if e is None:
+            return None
+        if e[0] <= now or e[1] != cache_generation():
+            del _MEM[key]
+            return None
+        _MEM.move_to_end(key)
+        return e[2]
+
+
+def _mem_put(key: str, ttl: int, val: Any) -> None:
+    expires = time.monotonic() + min(ttl, _MEM_MAX_TTL)
+    with _MEM_LOCK:
+        _MEM[key] = (expires, cache_generation(), val)
+        _MEM.move_to_end(key)
+        while len(_MEM) > _MEM_MAX_ITEMS:
+            _MEM.popitem(last=False)
+
+
+# Escritura del caché en segundo plano: el camino frío no espera encode + commit SQLite.
+# Mientras tanto el valor ya está en _MEM, así que una lectura inmediata
+# (p.ej. get_key_stats → get_profile_data) no vuelve a llamar a yfinance.
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-writer")
+atexit.register(_WRITER.shutdown, wait=True)
+
+
+# Single-flight: si varios hilos piden la misma key en frío, solo uno ejecuta fn()
+# y el resto espera su resultado (evita N llamadas iguales a yfinance/SEC).
+_INFLIGHT: dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+# XFetch (expiración temprana probabilística): cerca del TTL, cada lectura tiene una
+# probabilidad creciente de recalcular, proporcional a lo que costó calcular el valor.
+# Así una key caliente no expira para todos a la vez. β > 1 adelanta más el refresh.
+_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", "1.0"))
+
+
+def _xfetch_due(age: int, ttl: int, compute_ms: int | None) -> bool:
+    delta = (compute_ms or 0) / 1000.0
+    return age - delta * _XFETCH_BETA * math.log(1.0 - random.random()) >= ttl
+
+
+# Stale-while-revalidate: pasado el TTL "fresco", durante otros swr_ttl segundos se
+# sirve el valor viejo al instante y se recalcula en segundo plano. Pool acotado
+# para no abrir un hilo por key vencida. Es opt-in por key: solo datos lentos
+# (perfil, fundamentals, dividendos) usan _SWR_SLOW; quotes y yf:static no, porque
+# un precio viejo en pantalla es peor que esperar el refresh.
+_SWR_SLOW = 60 * 60 * 6
+_REFRESHER = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-swr")
+# Al salir no se esperan refrescos en curso: el dato viejo ya se sirvió
+atexit.register(_REFRESHER.shutdown, wait=False)
+
+# Keys encoladas o corriendo en _REFRESHER: nunca se encola la misma key dos veces,
+# y si la cola está llena el refresh se descarta (lo reintentará otra lectura).
+_REFRESH_PENDING: set[str] = set()
+_REFRESH_LOCK = threading.Lock()
+_REFRESH_MAX_PENDING = 32
+
+
+def _write_if_current(gen: int, key: str, val: Any, **kw: Any) -> None:
+    # Si hubo un "Limpiar caché" entre encolar y escribir, el valor es de antes del
+    # clear: no se resucita en SQLite.
+    if cache_generation() != gen:
+        return
+    cache_set(key, val, **kw)
+
+
+def _store(key: str, ttl: int, swr_ttl: int, val: Any, compute_ms: int, encoded: str | None = None) -> None:
+    gen = cache_generation()
+    _mem_put(key, ttl, val)
+    # En SQLite vive ttl + swr_ttl: la ventana stale sigue disponible para servir
+    _WRITER.submit(
+        _write_if_current, gen, key, val,
+        ttl_seconds=ttl + swr_ttl, compute_ms=compute_ms, value_json=encoded,
+    )
+
+
+def _compute_and_store(key: str, ttl: int, swr_ttl: int, fn: Callable[[], Any], skip_safe: bool) -> Any:
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        leader = fut is None
+        if leader:
+            fut = Future()
+            _INFLIGHT[key] = fut
+    if not leader:
+        return fut.result()
+
+    try:
+        t0 = time.monotonic()
+        val = fn()
+        compute_ms = int((time.monotonic() - t0) * 1000)
+        encoded = None
+        if not skip_safe:
+            val, encoded = _json_safe_dump(val)
+        _store(key, ttl, swr_ttl, val, compute_ms, encoded)
+        fut.set_result(val)
+        return val
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+
+
+def _run_refresh(key: str, ttl: int, swr_ttl: int, fn: Callable[[], Any], skip_safe: bool) -> None:
+    try:
+        _compute_and_store(key, ttl, swr_ttl, fn, skip_safe)
+    except Exception:
+        # Best effort: si falla, se sigue sirviendo el valor viejo
+        pass
+    finally:
+        with _REFRESH_LOCK:
+            _REFRESH_PENDING.discard(key)
+
+
+def _refresh_in_background(key: str, ttl: int, swr_ttl: int, fn: Callable[[], Any], skip_safe: bool) -> None:
+    if key in _INFLIGHT:
+        return
+    with _REFRESH_LOCK:
+        if key in _REFRESH_PENDING or len(_REFRESH_PENDING) >= _REFRESH_MAX_PENDING:
+            return
+        _REFRESH_PENDING.add(key)
+    try:
+        _REFRESHER.submit(_run_refresh, key, ttl, swr_ttl, fn, skip_safe)
+    except RuntimeError:
+        # Intérprete cerrando: el executor ya no acepta tareas
+        with _REFRESH_LOCK:
+            _REFRESH_PENDING.discard(key)
+
+
+def _cache_get_or_set(
+    key: str,
+    ttl: int,
+    fn: Callable[[], Any],
+    skip_safe: bool = False,
+    swr_ttl: int | None = None,
+):
+    """
+    ttl: ventana fresca. swr_ttl (opt-in; None = sin ventana stale): ventana extra en
+    la que se sirve el valor vencido y se refresca en segundo plano. Solo más allá de ttl + swr_ttl
+    (o sin dato) el caller espera a fn(); si fn() falla y hay una fila vieja, se
+    devuelve esa (stale-if-error).
+    skip_safe=True: el _load ya produce tipos JSON nativos (p.ej. payloads SEC),
+    así que se evita recorrerlo con _json_safe.
+    """
+    hit = _mem_get(key)
     if hit is not None:
         return hit
-    val = fn()
-    val = _json_safe(val)
-    cache_set(key, val, ttl_seconds=ttl)
-    return val
+
+    if swr_ttl is None:
+        swr_ttl = 0
+
+    entry = cache_get_entry(key)
+    if entry is not None:
+        age = entry["age"]
+        val = entry["value"]
+        if age <= ttl:
+            if key in _INFLIGHT:
+                return val
+            if _xfetch_due(age, ttl, entry["compute_ms"]):
+                # Ganó el sorteo XFetch → refresca antes de que expire para todos
+                _refresh_in_background(key, ttl, swr_ttl, fn, skip_safe)
+            else:
+                _mem_put(key, ttl - age, val)
+            return val
+        if age <= ttl + swr_ttl:
+            _refresh_in_background(key, ttl, swr_ttl, fn, skip_safe)
+            return val
+        # Stale-if-error: más viejo que la ventana SWR → se espera el refresh, pero si
+        # yfinance/SEC fallan, un dato viejo sirve más que una excepción en la página.
+        try:
+            return _compute_and_store(key, ttl, swr_ttl, fn, skip_safe)
+        except Exception:
+            return val
+    return _compute_and_store(key, ttl, swr_ttl, fn, skip_safe)
+
+
+@lru_cache(maxsize=4096)
+def _norm_ticker(ticker: str) -> str:
+    """' aapl ' -> 'AAPL'. Memoizado: get_static_data lo repite en cada sub-llamada."""
+    return ticker.strip().upper()
+
+
+# yf.Ticker compartido entre loaders del mismo ticker (precio, info): reutiliza su estado
+# interno (tz, metadata, fast_info). El bucket de tiempo en la key evita quedarse con
+# un fast_info viejo: pasado _TICKER_TTL se crea un Ticker nuevo y el LRU bota el anterior.
+_TICKER_TTL = 60
+
+
+@lru_cache(maxsize=256)
+def _ticker_for_bucket(t: str, bucket: int) -> Any:
+    return yf.Ticker(t)
+
+
+def _ticker(t: str) -> Any:
+    return _ticker_for_bucket(t, int(time.time() // _TICKER_TTL))
+
+
+def _fast_isoformat(ts: Any) -> str:
+    """'YYYY-MM-DD' desde date/datetime/Timestamp sin pasar por .date()/strftime."""
+    return f"{ts.year:04d}-{ts.month:02d}-{ts.day:02d}"
 
 
 def _to_iso_date(v: Any) -> str | None:
@@ -69,12 +373,12 @@ def _to_iso_date(v: Any) -> str | None:
         return None
     try:
         if isinstance(v, (datetime, date)):
-            return v.date().isoformat() if isinstance(v, datetime) else v.isoformat()
+            return _fast_isoformat(v)
         if isinstance(v, (int, float)):
             ts = float(v)
             if ts > 10_000_000_000:
                 ts = ts / 1000.0
-            return datetime.utcfromtimestamp(ts).date().isoformat()
+            return _fast_isoformat(datetime.fromtimestamp(ts, timezone.utc))
         if isinstance(v, str):
             s = v.strip()
             if len(s) >= 10:
@@ -85,85 +389,267 @@ def _to_iso_date(v: Any) -> str | None:
     return None
 
 
+def _first(d: dict, *keys: str) -> Any:
+    """Primer valor "truthy" entre keys (mismo criterio que encadenar d.get(a) or d.get(b))."""
+    for k in keys:
+        v = d.get(k)
+        if v:
+            return v
+    return None
+
+
+def _fast_read(fast: Any, *names: str) -> Any:
+    """
+    Primer valor no vacío de fast_info (FastInfo o dict) sin materializar dict(fast).
+    Usar DENTRO del lambda de yf_call: los atributos de FastInfo son lazy (cada
+    lectura puede ser un request), así que solo se ignoran campos inexistentes y los
+    errores de red/rate-limit llegan a yf_call.
+    """
+    if fast is None:
+        return None
+    for n in names:
+        try:
+            v = fast.get(n) if hasattr(fast, "get") else fast[n]
+        except (KeyError, AttributeError):
+            continue
+        if v is not None:
+            return v
+    return None
+
+
+def _market_date(md: Any) -> str | None:
+    """
+    Fecha de trading ('YYYY-MM-DD', en la zona de la bolsa) del último precio según la
+    metadata de history (regularMarketTime). None si no se conoce: mejor sin fecha
+    que con la fecha de hoy en un fin de semana/feriado.
+    """
+    if not isinstance(md, dict):
+        return None
+    ts = md.get("regularMarketTime")
+    if not isinstance(ts, (int, float)):
+        return None
+    try:
+        tz = ZoneInfo(md.get("exchangeTimezoneName") or "UTC")
+    except Exception:
+        tz = timezone.utc
+    try:
+        return _fast_isoformat(datetime.fromtimestamp(float(ts), tz))
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def _to_float(v: Any) -> float | None:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+_QUOTE_TTL = 60 * 5
+
+
+def _get_ticker_meta(t: str) -> dict:
+    """
+    currency / exchange del ticker (no cambian): TTL 90 días, así el refresh de 5 min
+    del precio no vuelve a pedir la metadata de fast_info.
+    """
+    key = f"yf:meta:{t}"
+    ttl = 60 * 60 * 24 * 90
+
+    def _read() -> dict:
+        fast = getattr(_ticker(t), "fast_info", None)
+        return {
+            "currency": _fast_read(fast, "currency"),
+            "exchange": _fast_read(fast, "exchange"),
+        }
+
+    def _load():
+        # Las lecturas de fast_info (lazy → HTTP) van dentro de yf_call: throttle,
+        # reintentos y breaker cubren el request real, no solo el getattr.
+        meta = yf_call_dedup(f"{t}:fast_info:meta", _read)
+        if meta["currency"] is None and meta["exchange"] is None:
+            # Nada útil (fallo silencioso/throttle de Yahoo): no se cachea 90 días
+            raise FinanceDataError(f"fast_info sin currency/exchange para {t}")
+        return meta
+
+    return _cache_get_or_set(key, ttl, _load, swr_ttl=_SWR_SLOW)
+
+
+def _quote_payload(t: str, price: float | None, prev: float | None, vol: Any, asof: str | None) -> dict:
+    """Arma el dict de quote (mismo shape para get_price_data y el camino bulk)."""
+    net = pct = None
+    if price is not None and prev is not None:
+        net = price - prev
+        pct = (net / prev) * 100 if prev else None
+
+    try:
+        vol = int(vol) if vol is not None else None
+    except (TypeError, ValueError):
+        vol = None
+
+    try:
+        meta = _get_ticker_meta(t) or {}
+    except Exception:
+        meta = {}
+    currency = meta.get("currency")
+    exchange = meta.get("exchange")
+
+    return {
+        "ticker": t,
+        "company_name": None,
+        "exchange": exchange or None,
+        "asset_class": "STOCKS",
+        "last_price": price,
+        "net_change": float(net) if net is not None else None,
+        "pct_change": float(pct) if pct is not None else None,
+        "volume": vol,
+        "currency": currency or None,
+        "asof": asof,
+    }
+
+
 def get_price_data(ticker: str) -> dict:
     """
     Devuelve datos de precio con TTL 5 minutos.
-    (Robusto ante rate-limit: si fast_info dispara error, igual intenta con history)
+    Camino rápido: last_price / previous_close / last_volume desde fast_info.
+    Solo si falta alguno se baja history(2d) (robusto ante rate-limit de fast_info).
     """
-    t = ticker.strip().upper()
+    t = _norm_ticker(ticker)
     key = f"yf:quote:{t}"
-    ttl = 60 * 5
+    ttl = _QUOTE_TTL
 
     def _load():
-        import yfinance as yf
-        tk = yf.Ticker(t)
-
-        price = None
-        currency = None
-        exchange = None
+        tk = _ticker(t)
+
+        def _read_fast() -> dict:
+            # Lecturas lazy de fast_info (HTTP) dentro de yf_call → dict plano
+            fast = getattr(tk, "fast_info", None)
+            out = {
+                "price": _fast_read(fast, "last_price", "last"),
+                "prev": _fast_read(fast, "regular_market_previous_close", "previous_close", "previousClose"),
+                "vol": _fast_read(fast, "last_volume"),
+            }
+            # fast_info ya bajó la metadata de history: de ahí sale la fecha del precio
+            try:
+                md = tk.get_history_metadata() if hasattr(tk, "get_history_metadata") else None
+            except (KeyError, AttributeError):
+                md = None
+            out["asof"] = _market_date(md)
+            return out
 
         try:
-            fast = yf_call(lambda: getattr(tk, "fast_info", None))
-            fast_dict = {}
-            if isinstance(fast, dict):
-                fast_dict = fast
-            else:
-                try:
-                    fast_dict = dict(fast)
-                except Exception:
-                    fast_dict = {}
-            price = fast_dict.get("last_price") or fast_dict.get("last") or None
-            currency = fast_dict.get("currency") or None
-            exchange = fast_dict.get("exchange") or None
+            fq = yf_call_dedup(f"{t}:fast_info:quote", _read_fast)
         except Exception:
-            pass
+            fq = {}
 
-        hist = None
-        try:
-            hist = yf_call(lambda: tk.history(period="2d", interval="1d", auto_adjust=True))
-        except Exception:
-            hist = None
+        price = _to_float(fq.get("price"))
+        prev = _to_float(fq.get("prev"))
+        vol = fq.get("vol")
+        asof = None
 
-        net = pct = vol = asof = None
-        if hist is not None and isinstance(hist, pd.DataFrame) and not hist.empty and "Close" in hist:
+        if price is None or prev is None or vol is None:
+            hist = None
             try:
-                last_close = float(hist["Close"].iloc[-1])
-                asof = str(hist.index[-1].date())
-                if "Volume" in hist:
-                    try:
-                        vol = int(hist["Volume"].iloc[-1])
-                    except Exception:
-                        vol = None
-
-                if price is None:
-                    price = last_close
-                else:
-                    try:
-                        price = float(price)
-                    except Exception:
+                # actions=False: sin columnas Dividends/Stock Splits (solo se usan Close/Volume)
+                hist = yf_call_dedup(
+                    f"{t}:history:2d:1d",
+                    lambda: tk.history(period="2d", interval="1d", auto_adjust=True, actions=False),
+                )
+            except Exception:
+                hist = None
+
+            if hist is not None and isinstance(hist, pd.DataFrame) and not hist.empty and "Close" in hist:
+                try:
+                    # to_numpy() una vez por columna: evita el stack de .iloc por elemento
+                    closes = hist["Close"].to_numpy()
+                    last_close = float(closes[-1])
+                    asof = _fast_isoformat(hist.index[-1])
+                    if vol is None and "Volume" in hist:
+                        try:
+                            vol = int(hist["Volume"].to_numpy()[-1])
+                        except Exception:
+                            vol = None
+
+                    if price is None:
                         price = last_close
 
-                if len(hist) >= 2:
-                    prev = float(hist["Close"].iloc[-2])
-                    net = last_close - prev
-                    pct = (net / prev) * 100 if prev else None
-            except Exception:
-                pass
+                    if prev is None and closes.size >= 2:
+                        prev = float(closes[-2])
+                except Exception:
+                    pass
+        else:
+            # Fecha de la barra, igual que history/bulk; None si no se conoce
+            asof = fq.get("asof")
 
-        return {
-            "ticker": t,
-            "company_name": None,
-            "exchange": exchange,
-            "asset_class": "STOCKS",
-            "last_price": float(price) if price is not None else None,
-            "net_change": float(net) if net is not None else None,
-            "pct_change": float(pct) if pct is not None else None,
-            "volume": vol,
-            "currency": currency,
-            "asof": asof,
-        }
+        return _quote_payload(t, price, prev, vol, asof)
+
+    # floats/ints ya convertidos (_to_float, int) + strings de yf:meta
+    return _cache_get_or_set(key, ttl, _load, skip_safe=True)
+
+
+def get_info(ticker: str) -> dict:
+    """
+    tk.info de yfinance (ya JSON-safe), compartido por perfil y financial data:
+    es el scrape más caro de yfinance y antes se pedía dos o tres veces por ticker.
+    TTL 24h (el de financial data, que toma de aquí datos de mercado/analistas).
+    """
+    t = _norm_ticker(ticker)
+    key = f"yf:info:{t}"
+    ttl = 60 * 60 * 24
+
+    def _load():
+        tk = _ticker(t)
+        info = yf_call_dedup(f"{t}:info", lambda: tk.info or {}) or {}
+        return info if isinstance(info, dict) else {}
+
+    return _cache_get_or_set(key, ttl, _load, swr_ttl=_SWR_SLOW)
+
+
+# Campos planos del perfil (mismo nombre que en tk.info); longName va aparte por su fallback
+_PROFILE_FIELDS = ("shortName", "website", "sector", "industry")
+
+
+# Campos de info que usan key stats y KPIs de dividendos
+_STATS_RAW_KEYS = (
+    "beta",
+    "epsTrailingTwelveMonths",
+    "trailingEps",
+    "targetMeanPrice",
+    "targetMedianPrice",
+    "targetHighPrice",
+    "trailingPE",
+    "peTrailingTwelveMonths",
+    "dividendRate",
+    "trailingAnnualDividendRate",
+    "lastDividendValue",
+    "dividendYield",
+    "payoutRatio",
+    "exDividendDate",
+)
+
+_PROFILE_TTL = 60 * 60 * 24 * 30
+
+
+def _stats_projection(info: dict) -> dict:
+    return {k: info.get(k) for k in _STATS_RAW_KEYS}
+
+
+def _get_stats_raw(t: str) -> dict:
+    """
+    Proyección chica del info (solo _STATS_RAW_KEYS) en yf:keystats_raw: key stats /
+    dividendos leen ~14 campos en vez de decodificar el info completo.
+    La escribe get_profile_data junto con el perfil (misma carga, mismo TTL), así que
+    nunca es más vieja que él. Si falta (p.ej. perfil cacheado antes de que existiera),
+    se proyecta desde yf:info con su TTL de 24h, no desde un perfil ya cacheado.
+    """
+    key = f"yf:keystats_raw:{t}"
+    ttl = 60 * 60 * 24
 
-    return _cache_get_or_set(key, ttl, _load)
+    def _load():
+        return _stats_projection(get_info(t) or {})
+
+    return _cache_get_or_set(key, ttl, _load, skip_safe=True)
 
 
 def get_profile_data(ticker: str) -> dict:
@@ -171,48 +657,24 @@ def get_profile_data(ticker: str) -> dict:
     Perfil robusto con fallback: TTL 30 días.
     (Se mantiene en yfinance por ahora; no es la parte “pesada” comparado con fundamentals)
     """
-    t = ticker.strip().upper()
+    t = _norm_ticker(ticker)
     key = f"yf:profile:{t}"
-    ttl = 60 * 60 * 24 * 30
+    ttl = _PROFILE_TTL
 
     def _load():
-        import yfinance as yf
-        tk = yf.Ticker(t)
+        # tk.get_info() es lo mismo que tk.info, y basic_info (FastInfo) no es un dict,
+        # así que nunca aportaba al merge: basta con el info compartido.
+        merged = get_info(t) or {}
 
-        info1 = yf_call(lambda: tk.info or {}) or {}
-        info2 = {}
-        try:
-            if hasattr(tk, "get_info"):
-                info2 = yf_call(lambda: tk.get_info() or {}) or {}
-        except Exception:
-            pass
-        info3 = {}
-        try:
-            info3 = yf_call(lambda: getattr(tk, "basic_info", {}) or {}) or {}
-        except Exception:
-            pass
+        out = {"longName": _first(merged, "longName", "shortName")}
+        out.update({k: merged.get(k) or None for k in _PROFILE_FIELDS})
+        out["raw"] = merged
+        # Sidecar de key stats/dividendos: mismo momento y mismo TTL que el perfil
+        _store(f"yf:keystats_raw:{t}", ttl, _SWR_SLOW, _stats_projection(merged), 0)
+        return out
 
-        merged = {}
-        for d in (info3, info2, info1):
-            if isinstance(d, dict):
-                merged.update(d)
-
-        long = merged.get("longName") or merged.get("shortName") or None
-        short = merged.get("shortName") or None
-        website = merged.get("website") or None
-        sector = merged.get("sector") or None
-        industry = merged.get("industry") or None
-
-        return {
-            "longName": long,
-            "shortName": short,
-            "website": website,
-            "sector": sector,
-            "industry": industry,
-            "raw": _json_safe(merged),
-        }
-
-    return _cache_get_or_set(key, ttl, _load)
+    # merged ya viene JSON-safe desde yf:info → no se vuelve a recorrer
+    return _cache_get_or_set(key, ttl, _load, skip_safe=True, swr_ttl=_SWR_SLOW)
 
 
 # -----------------------------
@@ -223,14 +685,41 @@ def get_sec_fundamentals(ticker: str) -> dict:
     Fundamentals “mínimos” desde SEC (companyfacts).
     TTL 24h.
     """
-    t = ticker.strip().upper()
+    t = _norm_ticker(ticker)
     key = f"sec:fundamentals:{t}"
     ttl = 60 * 60 * 24
 
     def _load():
         return get_fundamentals_minimal(t) or {}
 
-    return _cache_get_or_set(key, ttl, _load)
+    # companyfacts viene de JSON → series ya son str/int/float/None
+    return _cache_get_or_set(key, ttl, _load, skip_safe=True, swr_ttl=_SWR_SLOW)
+
+
+# (clave de salida, clave origen) — agregar un campo es una línea
+_FIN_SEC_FIELDS = (
+    ("total_cash", "cash"),
+    ("total_debt", "debt"),
+    ("total_revenue", "revenue"),
+    ("gross_profits", "gross_profit"),
+    ("operating_cashflow", "operating_cf"),
+    ("free_cashflow", "free_cf"),
+)
+
+# Lo que sí seguimos tomando de yfinance (cuando exista). Liquidez / ratios contables
+# y márgenes: si no están, N/D (se pueden calcular luego desde SEC con más mapeo)
+_FIN_YF_FIELDS = (
+    ("target_mean_price", "targetMeanPrice"),
+    ("recommendation_key", "recommendationKey"),
+    ("analyst_opinions", "numberOfAnalystOpinions"),
+    ("ebitda", "ebitda"),
+    ("quick_ratio", "quickRatio"),
+    ("current_ratio", "currentRatio"),
+    ("debt_to_equity", "debtToEquity"),
+    ("gross_margins", "grossMargins"),
+    ("ebitda_margins", "ebitdaMargins"),
+    ("operating_margins", "operatingMargins"),
+)
 
 
 def get_financial_data(ticker: str) -> dict:
@@ -241,7 +730,7 @@ def get_financial_data(ticker: str) -> dict:
 
     TTL recomendado: 24h (SEC) — porque se recalcula fácil y depende de filings.
     """
-    t = ticker.strip().upper()
+    t = _norm_ticker(ticker)
     key = f"mix:financial:{t}"
     ttl = 60 * 60 * 24  # 24h
 
@@ -254,14 +743,7 @@ def get_financial_data(ticker: str) -> dict:
 
         revenue = latest.get("revenue")
         net_income = latest.get("net_income")
-        assets = latest.get("assets")
-        liabilities = latest.get("liabilities")
         equity = latest.get("equity")
-        cash = latest.get("cash")
-        debt = latest.get("debt")
-        operating_cf = latest.get("operating_cf")
-        capex = latest.get("capex")
-        free_cf = latest.get("free_cf")
 
         # Ratios “calculables” (best effort)
         profit_margin = None
@@ -298,64 +780,28 @@ def get_financial_data(ticker: str) -> dict:
         # 2) Campos de mercado/analistas (yfinance fallback)
         yinfo = {}
         try:
-            import yfinance as yf
-            tk = yf.Ticker(t)
-            yinfo = yf_call(lambda: tk.info or {}) or {}
-            yinfo = _json_safe(yinfo)
+            yinfo = get_info(t) or {}
         except Exception:
             yinfo = {}
 
-        # Lo que sí seguimos tomando de yfinance (cuando exista)
-        fin_currency = yinfo.get("financialCurrency") or yinfo.get("currency")
-        target_mean = yinfo.get("targetMeanPrice")
-        reco = yinfo.get("recommendationKey")
-        analyst_ops = yinfo.get("numberOfAnalystOpinions")
-
-        # Liquidez / ratios contables que antes venían de yfinance: si no están, N/D
-        # (se pueden calcular luego desde SEC con más mapeo)
-        quick_ratio = yinfo.get("quickRatio")
-        current_ratio = yinfo.get("currentRatio")
-        debt_to_equity = yinfo.get("debtToEquity")
-
-        # Márgenes (si yfinance los tiene, los dejamos como fallback)
-        gross_margins = yinfo.get("grossMargins")
-        ebitda_margins = yinfo.get("ebitdaMargins")
-        operating_margins = yinfo.get("operatingMargins")
-
-        return {
-            "financial_currency": fin_currency,
-
+        out = {
+            "financial_currency": _first(yinfo, "financialCurrency", "currency"),
             # Precio/mercado
             "current_price": last_price if isinstance(last_price, (int, float)) else yinfo.get("currentPrice"),
-            "target_mean_price": target_mean,
-            "recommendation_key": reco,
-            "analyst_opinions": analyst_ops,
-
-            # Balance / fundamentals (SEC)
-            "total_cash": cash,
-            "total_debt": debt,
-            "total_revenue": revenue,
-            "gross_profits": latest.get("gross_profit"),
-            "operating_cashflow": operating_cf,
-            "free_cashflow": free_cf,
-
-            # Ratios / crecimiento (SEC best effort)
-            "roe": roe,                          # (decimal)
-            "earnings_growth": earn_growth,      # (decimal YoY)
-            "revenue_growth": rev_growth,        # (decimal YoY)
-            "profit_margins": profit_margin,     # (decimal)
-
-            # Fallback yfinance / por completar (no rompe)
-            "ebitda": yinfo.get("ebitda"),
-            "quick_ratio": quick_ratio,
-            "current_ratio": current_ratio,
-            "debt_to_equity": debt_to_equity,
-            "gross_margins": gross_margins,
-            "ebitda_margins": ebitda_margins,
-            "operating_margins": operating_margins,
         }
+        # Balance / fundamentals (SEC)
+        out.update({k: latest.get(src) for k, src in _FIN_SEC_FIELDS})
+        # Ratios / crecimiento (SEC best effort, decimales)
+        out["roe"] = roe
+        out["earnings_growth"] = earn_growth
+        out["revenue_growth"] = rev_growth
+        out["profit_margins"] = profit_margin
+        # Mercado/analistas + fallback yfinance / por completar (no rompe)
+        out.update({k: yinfo.get(src) for k, src in _FIN_YF_FIELDS})
+        return out
 
-    return _cache_get_or_set(key, ttl, _load)
+    # Todo sale de payloads ya cacheados (SEC, yf:info, precio) o de floats calculados
+    return _cache_get_or_set(key, ttl, _load, skip_safe=True, swr_ttl=_SWR_SLOW)
 
 
 def get_key_stats(ticker: str) -> dict:
@@ -367,17 +813,16 @@ def get_key_stats(ticker: str) -> dict:
       - PER: calculado con precio/eps cuando sea posible
     TTL 30 días.
     """
-    t = ticker.strip().upper()
+    t = _norm_ticker(ticker)
     key = f"mix:keystats:{t}"
     ttl = 60 * 60 * 24 * 30
 
     def _load():
-        prof = get_profile_data(t)
-        raw = prof.get("raw") if isinstance(prof, dict) else {}
+        raw = _get_stats_raw(t)
 
         beta = raw.get("beta")
-        eps = raw.get("epsTrailingTwelveMonths") or raw.get("trailingEps")
-        target = raw.get("targetMeanPrice") or raw.get("targetMedianPrice") or raw.get("targetHighPrice")
+        eps = _first(raw, "epsTrailingTwelveMonths", "trailingEps")
+        target = _first(raw, "targetMeanPrice", "targetMedianPrice", "targetHighPrice")
 
         # Precio actual para PER
         price = get_price_data(t) or {}
@@ -391,9 +836,11 @@ def get_key_stats(ticker: str) -> dict:
                 pe_calc = None
 
         # fallback a yfinance trailingPE si existe
-        pe = pe_calc or raw.get("trailingPE") or raw.get("peTrailingTwelveMonths")
+        pe = pe_calc or _first(raw, "trailingPE", "peTrailingTwelveMonths")
 
-        if target is None:
+        # financial data toma target del mismo yf:info que raw; solo vale la pena
+        # (SEC + info) cuando el perfil vino vacío, no cuando solo falta el target.
+        if target is None and pe is None and eps is None:
             fin = get_financial_data(t)
             target = fin.get("target_mean_price")
 
@@ -404,7 +851,8 @@ def get_key_stats(ticker: str) -> dict:
             "target_1y": target,
         }
 
-    return _cache_get_or_set(key, ttl, _load)
+    # valores de yf:info (ya JSON-safe) + floats calculados
+    return _cache_get_or_set(key, ttl, _load, skip_safe=True, swr_ttl=_SWR_SLOW)
 
 
 # ✅ Se mantiene: KPIs dividendos (yfinance)
@@ -419,24 +867,19 @@ def get_dividend_kpis(ticker: str) -> dict:
     - Próximo Dividendo $: lastDividendValue (fallback)
     TTL: 24h (varía poco)
     """
-    t = ticker.strip().upper()
+    t = _norm_ticker(ticker)
     key = f"yf:divkpis:{t}"
     ttl = 60 * 60 * 24  # 24h
 
     def _load():
-        prof = get_profile_data(t) or {}
-        raw = prof.get("raw") if isinstance(prof, dict) else {}
+        raw = _get_stats_raw(t)
         price = get_price_data(t) or {}
         stats = get_key_stats(t) or {}
 
         last_price = price.get("last_price")
         eps_ttm = stats.get("eps_ttm")
 
-        annual = (
-            raw.get("dividendRate")
-            or raw.get("trailingAnnualDividendRate")
-            or None
-        )
+        annual = _first(raw, "dividendRate", "trailingAnnualDividendRate")
         try:
             annual = float(annual) if annual is not None else None
         except Exception:
@@ -481,4 +924,153 @@ def get_dividend_kpis(ticker: str) -> dict:
             "next_dividend": nxt,
         }
 
-    return _cache_get_or_set(key, ttl, _load)
+    # floats calculados + fecha ISO (str)
+    return _cache_get_or_set(key, ttl, _load, skip_safe=True, swr_ttl=_SWR_SLOW)
+
+
+# Pool compartido para las cargas en paralelo de get_static_data: reutiliza hilos en
+# vez de crear y destruir un executor por llamada. Sus tareas no vuelven a usarlo
+# (no hay riesgo de deadlock por anidar submits).
+_IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="static-io")
+atexit.register(_IO_POOL.shutdown, wait=False)
+
+
+def get_static_data(ticker: str) -> dict:
+    """
+    Agregador para la página de análisis: precio, perfil, key stats y KPIs de dividendos.
+    Precio y perfil son independientes (I/O) → en cache frío se piden en paralelo;
+    key stats y dividendos se derivan de ellos (ya cacheados).
+    Solo las partes lentas (perfil, stats, dividendos) se cachean juntas, para que un
+    hit sea una sola lectura; el precio se lee siempre por get_price_data (tier de
+    memoria) y nunca queda más viejo que su propio TTL. El single-flight de
+    _cache_get_or_set hace que N visitas concurrentes al mismo ticker en frío
+    compartan una sola carga.
+    """
+    t = _norm_ticker(ticker)
+    key = f"yf:static:{t}"
+    ttl = 60 * 5
+
+    def _load():
+        # El precio se pide igual en paralelo: stats/dividendos lo necesitan y así
+        # la lectura de abajo ya es un hit
+        fq = _IO_POOL.submit(get_price_data, t)
+        fp = _IO_POOL.submit(get_profile_data, t)
+        fq.result()
+        profile = fp.result()
+
+        # Solo los campos planos del perfil: "raw" (info completo de yfinance) ya vive
+        # en yf:profile y duplicarlo aquí inflaría cada lectura del agregado.
+        profile = {k: v for k, v in (profile or {}).items() if k != "raw"}
+
+        return {
+            "profile": profile,
+            "stats": get_key_stats(t) or {},
+            "dividends": get_dividend_kpis(t) or {},
+        }
+
+    # Las partes ya salen de _cache_get_or_set → JSON nativo
+    slow = _cache_get_or_set(key, ttl, _load, skip_safe=True)
+    # dict nuevo (el valor cacheado se comparte entre llamadas); "price" va último para
+    # pisar el de filas yf:static escritas antes de este cambio
+    return {**slow, "price": get_price_data(t) or {}}
+
+
+def _download_quotes(ts: list[str]) -> dict[str, dict]:
+    """
+    Quotes de varios tickers con un yf.download(period=2d) (yf_batch_history).
+    Retorna solo los tickers con al menos un cierre; el resto lo resuelve el caller.
+    """
+    try:
+        frames = yf_batch_history(ts, period="2d", interval="1d", auto_adjust=True)
+    except Exception:
+        return {}
+
+    out: dict[str, dict] = {}
+    for t, sub in frames.items():
+        try:
+            sub = sub.dropna(subset=["Close"])
+            if sub.empty:
+                continue
+            closes = sub["Close"].to_numpy()
+            price = float(closes[-1])
+            prev = float(closes[-2]) if closes.size >= 2 else None
+            vol = sub["Volume"].to_numpy()[-1] if "Volume" in sub else None
+            asof = _fast_isoformat(sub.index[-1])
+        except Exception:
+            continue
+        out[t] = _quote_payload(t, price, prev, vol, asof)
+    return out
+
+
+def get_price_data_bulk(tickers: list[str]) -> dict[str, dict]:
+    """
+    get_price_data para varios tickers: hits del caché con una sola lectura, misses con
+    un solo yf.download y lo que quede en paralelo (_IO_POOL); el throttle global de
+    yf_call ya espacia los requests, así que no hace falta jitter extra.
+    Un ticker que falla queda como {}.
+    """
+    ts = list(dict.fromkeys(_norm_ticker(x) for x in tickers if x and x.strip()))
+    out: dict[str, dict] = {}
+
+    # Hits frescos en un solo SELECT; solo los misses/vencidos se piden a yfinance
+    pending = []
+    for t in ts:
+        hit = _mem_get(f"yf:quote:{t}")
+        if hit is not None:
+            out[t] = hit
+        else:
+            pending.append(t)
+    entries = cache_mget([f"yf:quote:{t}" for t in pending])
+    misses = []
+    for t in pending:
+        e = entries.get(f"yf:quote:{t}")
+        if e is not None and e["age"] <= _QUOTE_TTL:
+            out[t] = e["value"]
+            _mem_put(f"yf:quote:{t}", _QUOTE_TTL - e["age"], e["value"])
+        else:
+            misses.append(t)
+
+    # Varios misses → un solo yf.download (un turno del throttle para todo el lote)
+    if len(misses) > 1:
+        t0 = time.monotonic()
+        batch = _download_quotes(misses)
+        compute_ms = int((time.monotonic() - t0) * 1000) // len(misses)
+        for t, q in batch.items():
+            out[t] = q
+            # Sin ventana stale, igual que get_price_data: filas idénticas en ambos caminos
+            _store(f"yf:quote:{t}", _QUOTE_TTL, 0, q, compute_ms)
+        misses = [t for t in misses if t not in batch]
+
+    # Lo que el batch no trajo (o un único miss) va por el camino normal
+    futs = {t: _IO_POOL.submit(get_price_data, t) for t in misses}
+    for t, f in futs.items():
+        try:
+            out[t] = f.result() or {}
+        except Exception:
+            out[t] = {}
+    return {t: out[t] for t in ts}
+
+
+def get_static_data_many(tickers: list[str]) -> dict[str, dict]:
+    """
+    get_static_data para varios tickers: primero precio + perfil de todos en paralelo
+    (las cargas de I/O) sobre _IO_POOL, que con 4 workers además acota la presión
+    sobre yfinance; luego se arma cada agregado, que ya lee esas partes del caché.
+    Un ticker que falla queda como {} (no tumba el lote).
+    """
+    ts = list(dict.fromkeys(_norm_ticker(x) for x in tickers if x and x.strip()))
+
+    warm = [_IO_POOL.submit(fn, t) for t in ts for fn in (get_price_data, get_profile_data)]
+    for f in warm:
+        try:
+            f.result()
+        except Exception:
+            pass
+
+    out: dict[str, dict] = {}
+    for t in ts:
+        try:
+            out[t] = get_static_data(t)
+        except Exception:
+            out[t] = {}
+    return out
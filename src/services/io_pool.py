@@ -0,0 +1,17 @@
+# src/services/io_pool.py
+from __future__ import annotations
+
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool compartido para fan-out de I/O "hoja" (HEAD de logos):
+# los hilos viven todo el proceso (sobreviven a los reruns de Streamlit porque el
+# módulo queda importado) en vez de crear/destruir un pool por llamada.
+# OJO: las tareas enviadas aquí NO deben a su vez esperar otras tareas del mismo
+# pool (deadlock si se llena); para agregados anidados está _IO_POOL en finance_data.
+_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="coke-io")
+atexit.register(_POOL.shutdown, wait=False)
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    return _POOL
@@ -1,9 +1,21 @@
 # src/services/logos.py
 
+from functools import lru_cache
 from urllib.parse import urlparse
 import requests
 
+from src.services.cache_store import cache_get, cache_set
+from src.services.io_pool import get_io_pool
 
+# Los logos de un dominio casi no cambian: 7 días; sin logo válido se reintenta en 1h.
+_LOGOS_TTL = 7 * 24 * 3600
+_LOGOS_EMPTY_TTL = 3600
+
+_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+
+# Pura y llamada con las mismas URLs en cada rerun → memo.
+@lru_cache(maxsize=2048)
 def _clean_domain(url: str) -> str:
     if not url:
         return ""
@@ -17,18 +29,27 @@ def _clean_domain(url: str) -> str:
 def _is_valid_image(url: str, timeout: float = 2.5) -> bool:
     """
     Verifica que la URL responda 200 y sea una imagen real.
+    HEAD basta para leer Content-Type; si el servidor no soporta HEAD (405/501)
+    se reintenta con un GET de 1 byte.
     """
     try:
-        r = requests.get(
-            url,
-            timeout=timeout,
-            headers={"User-Agent": "Mozilla/5.0"},
-            stream=True,
-        )
-        if r.status_code != 200:
-            return False
+        with requests.head(url, timeout=timeout, headers=_HEADERS, allow_redirects=True) as r:
+            status = r.status_code
+            content_type = r.headers.get("Content-Type", "")
 
-        content_type = r.headers.get("Content-Type", "")
+        if status in (405, 501):
+            with requests.get(
+                url,
+                timeout=timeout,
+                headers={**_HEADERS, "Range": "bytes=0-0"},
+                stream=True,
+            ) as r:
+                # 206 = Range aceptado
+                status = 200 if r.status_code == 206 else r.status_code
+                content_type = r.headers.get("Content-Type", "")
+
+        if status != 200:
+            return False
         return content_type.startswith("image/")
     except Exception:
         return False
@@ -42,6 +63,11 @@ def logo_candidates(company_website: str) -> list[str]:
     if not domain:
         return []
 
+    key = f"logos:{domain}"
+    hit = cache_get(key)
+    if hit is not None:
+        return hit
+
     candidates = [
         # Mejor calidad (logo real)
         f"https://logo.clearbit.com/{domain}",
@@ -53,9 +79,10 @@ def logo_candidates(company_website: str) -> list[str]:
         f"https://{domain}/favicon.ico",
     ]
 
-    valid_logos = []
-    for url in candidates:
-        if _is_valid_image(url):
-            valid_logos.append(url)
+    # Validación IO-bound: los 4 candidatos se prueban en paralelo (peor caso ~1
+    # timeout, no 4); map conserva el orden de prioridad de los candidatos.
+    results = list(get_io_pool().map(_is_valid_image, candidates))
+    valid_logos = [u for u, ok in zip(candidates, results) if ok]
 
+    cache_set(key, valid_logos, ttl_seconds=_LOGOS_TTL if valid_logos else _LOGOS_EMPTY_TTL)
     return valid_logos
@@ -2,17 +2,48 @@
 from __future__ import annotations
 
 import random
+import threading
 import time
+from collections import OrderedDict
 from typing import Any
 
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from src.services.cache_store import cache_get, cache_set
+try:
+    import orjson
+except Exception:
+    orjson = None  # type: ignore
+
+from src.services.cache_store import cache_delete, cache_generation, cache_get, cache_incr, cache_set
+
+
+# orjson parsea directo desde bytes (sin decodificar a str), bastante más rápido
+# que json stdlib en payloads grandes. Ambos lanzan ValueError.
+def _parse_json(r: requests.Response) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(r.content)
+        except orjson.JSONDecodeError:
+            # orjson rechaza NaN/Infinity (JSON no estándar); json de stdlib los acepta
+            pass
+    return r.json()
 
 
 class RapidAPIError(RuntimeError):
-    pass
+    def __init__(self, message: str, status: int | None = None, config: bool = False):
+        super().__init__(message)
+        self.status = status
+        # config=True: falta/está mal la configuración local (no dice nada del host)
+        self.config = config
+
+
+# 404/422: el ticker/endpoint no existe → repetir pronto no cambia la respuesta.
+# Se cachea el negativo más tiempo que un error transitorio (429/5xx/red).
+_NEGATIVE_STATUSES = (404, 422)
+_NEGATIVE_TTL_SECONDS = 120
 
 
 def _secret(name: str, default=None):
@@ -30,71 +61,187 @@ RAPIDAPI_BASE_URL = _secret("RAPIDAPI_BASE_URL", "https://yahoo-finance15.p.rapi
 RAPIDAPI_API_PREFIX = (_secret("RAPIDAPI_API_PREFIX", "") or "").strip()
 
 
-def _build_url(path: str) -> str:
-    if not path.startswith("/"):
-        path = "/" + path
+# Full jitter (uniforme en [0, min(exp, cap)]): sesiones que chocaron con el mismo
+# 429 no reintentan todas a la vez. Si el server manda Retry-After, urllib3 lo usa
+# en lugar de este backoff, pero acotado a _RETRY_AFTER_CAP_SEC: un Retry-After de
+# minutos bloquearía el hilo del script de Streamlit.
+_BACKOFF_CAP_SEC = 8.0
+_RETRY_AFTER_CAP_SEC = 10.0
+
 
-    prefix = RAPIDAPI_API_PREFIX
-    if prefix and not prefix.startswith("/"):
-        prefix = "/" + prefix
+class _JitterRetry(Retry):
+    def get_backoff_time(self) -> float:
+        base = super().get_backoff_time()
+        return random.uniform(0, min(base, _BACKOFF_CAP_SEC)) if base > 0 else 0
 
-    return RAPIDAPI_BASE_URL.rstrip("/") + prefix + path
+    def get_retry_after(self, response) -> float | None:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, _RETRY_AFTER_CAP_SEC)
+
+
+# Una sola Session por proceso: keep-alive + pool → el TLS con el host de RapidAPI
+# se negocia una vez y las llamadas siguientes reutilizan la conexión.
+# Retry del adapter cubre fallos de conexión/lectura y 429/5xx con backoff
+# exponencial (respetando Retry-After); al agotarse devuelve la última respuesta.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=_JitterRetry(
+        total=4,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    ),
+)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+# Headers fijos en la Session (una vez al importar, no un dict nuevo por request)
+_SESSION.headers.update(
+    {
+        "x-rapidapi-key": RAPIDAPI_KEY or "",
+        "x-rapidapi-host": RAPIDAPI_HOST,
+        "User-Agent": "CokeDividendosApp/1.0",
+        "Accept": "application/json",
+    }
+)
+
+
+# Base + prefijo resueltos una vez al importar; _build_url solo concatena el path.
+_PREFIX = ("/" + RAPIDAPI_API_PREFIX.lstrip("/")) if RAPIDAPI_API_PREFIX else ""
+_ROOT_URL = RAPIDAPI_BASE_URL.rstrip("/") + _PREFIX
+
+
+def _build_url(path: str) -> str:
+    return _ROOT_URL + (path if path.startswith("/") else "/" + path)
 
 
 def rapidapi_get(path: str, params: dict | None = None, timeout: int = 25) -> dict:
     """
     GET robusto con:
-    - retries + exponential backoff para 429 y 5xx
+    - retries + exponential backoff para 429 y 5xx (Retry del adapter, respeta Retry-After)
     - errores con snippet del body
     - validación de JSON
     """
     if not RAPIDAPI_KEY:
-        raise RapidAPIError("Falta RAPIDAPI_KEY en st.secrets.")
+        raise RapidAPIError("Falta RAPIDAPI_KEY en st.secrets.", config=True)
 
     url = _build_url(path)
 
-    headers = {
-        "x-rapidapi-key": RAPIDAPI_KEY,
-        "x-rapidapi-host": RAPIDAPI_HOST,
-        "User-Agent": "CokeDividendosApp/1.0",
-        "Accept": "application/json",
-    }
+    try:
+        r = _SESSION.get(url, params=params or {}, timeout=timeout)
+    except requests.RequestException as e:
+        raise RapidAPIError(f"Error de red: {e}") from e
 
-    max_attempts = 4
-    last_status = None
-    last_text = ""
-
-    for attempt in range(1, max_attempts + 1):
-        r = requests.get(url, headers=headers, params=params or {}, timeout=timeout)
-        last_status = r.status_code
-        last_text = r.text or ""
-
-        # 429 / 5xx -> retry con backoff
-        if r.status_code in (429, 500, 502, 503, 504):
-            if attempt == max_attempts:
-                break
-            sleep_s = (2 ** (attempt - 1)) + random.uniform(0, 0.5)
-            time.sleep(sleep_s)
-            continue
-
-        # cualquier otro status rompe el loop
-        break
-
-    # Errores HTTP (incluye 4xx)
-    if last_status is None:
-        raise RapidAPIError("No hubo respuesta del servidor.")
-    if last_status >= 400:
-        snippet = last_text[:300]
-        raise RapidAPIError(f"HTTP {last_status}. Respuesta (primeros 300 chars): {snippet}")
+    # Errores HTTP (incluye 4xx y 429/5xx que agotaron los reintentos del adapter)
+    if r.status_code >= 400:
+        snippet = (r.content or b"")[:300].decode("utf-8", "replace")
+        raise RapidAPIError(f"HTTP {r.status_code}. Respuesta (primeros 300 chars): {snippet}", status=r.status_code)
 
     # JSON parse
     try:
-        return r.json()
+        return _parse_json(r)
     except ValueError:
         ct = r.headers.get("content-type", "")
-        snippet = last_text[:300]
+        snippet = (r.content or b"")[:300].decode("utf-8", "replace")
         raise RapidAPIError(
-            f"La respuesta NO es JSON (content-type: {ct}). Primeros 300 chars: {snippet}"
+            f"La respuesta NO es JSON (content-type: {ct}). Primeros 300 chars: {snippet}",
+            status=r.status_code,
+        )
+
+
+# Memo en proceso delante de kv_cache: la misma respuesta pedida varias veces en un
+# render no vuelve a SQLite. TTL corto (máx 30s) e invalidado por cache_clear.
+_MEM_MAX_ITEMS = 512
+_MEM_MAX_TTL = 30
+_MEM: "OrderedDict[str, tuple[float, int, Any]]" = OrderedDict()
+_MEM_LOCK = threading.Lock()
+
+
+def _mem_get(key: str) -> Any:
+    now = time.monotonic()
+    with _MEM_LOCK:
+        e = _MEM.get(key)
+        if e is None:
+            return None
+        if e[0] <= now or e[1] != cache_generation():
+            del _MEM[key]
+            return None
+        _MEM.move_to_end(key)
+        return e[2]
+
+
+def _mem_put(key: str, ttl: int, val: Any) -> None:
+    expires = time.monotonic() + min(ttl, _MEM_MAX_TTL)
+    with _MEM_LOCK:
+        _MEM[key] = (expires, cache_generation(), val)
+        _MEM.move_to_end(key)
+        while len(_MEM) > _MEM_MAX_ITEMS:
+            _MEM.popitem(last=False)
+
+
+# Circuit breaker por host (estado en kv_cache → compartido entre procesos/reruns):
+# _BREAKER_THRESHOLD fallos transitorios seguidos → OPEN durante _BREAKER_OPEN_SECONDS
+# (falla en ~0ms sin tocar la red); al vencer, un solo caller prueba (HALF_OPEN).
+# Contador de fallos y ticket de sonda van por cache_incr (UPSERT atómico): varias
+# sesiones a la vez no pierden fallos ni entran todas como sonda.
+_BREAKER_THRESHOLD = 5
+_BREAKER_OPEN_SECONDS = 30
+_BREAKER_STATE_TTL = _BREAKER_OPEN_SECONDS * 10
+
+# 401/403: key inválida o sin suscripción → problema de config, no de salud del host
+_AUTH_STATUSES = (401, 403)
+
+
+def _breaker_key() -> str:
+    return f"cb:{RAPIDAPI_HOST}"
+
+
+def _is_transient(e: RapidAPIError) -> bool:
+    # red (sin status), 429 y 5xx; 4xx "de negocio" no dicen nada de la salud del host
+    return e.status is None or e.status == 429 or e.status >= 500
+
+
+def _is_config_error(e: RapidAPIError) -> bool:
+    return e.config or e.status in _AUTH_STATUSES
+
+
+def _breaker_allow() -> bool:
+    cb = cache_get(_breaker_key())
+    if not isinstance(cb, dict):
+        return True
+    until = float(cb.get("until") or 0)
+    if time.time() < until:
+        return False
+    # OPEN vencido → HALF_OPEN: un solo ticket de sonda por período abierto. Si la
+    # sonda se cuelga, el ticket vence con el TTL y entra otra.
+    ok, _ = cache_incr(
+        f"{_breaker_key()}:probe:{int(until)}",
+        1,
+        ttl_seconds=_BREAKER_OPEN_SECONDS,
+        max_value=1,
+    )
+    return ok
+
+
+def _breaker_success() -> None:
+    if cache_get(_breaker_key()) is not None or cache_get(_breaker_key() + ":fail"):
+        cache_delete(_breaker_key())
+        cache_delete(_breaker_key() + ":fail")
+
+
+def _breaker_failure() -> None:
+    _, fails = cache_incr(_breaker_key() + ":fail", 1, ttl_seconds=_BREAKER_STATE_TTL)
+    # Sonda HALF_OPEN fallida (había estado OPEN) o umbral alcanzado → (re)abre
+    if fails >= _BREAKER_THRESHOLD or cache_get(_breaker_key()) is not None:
+        cache_set(
+            _breaker_key(),
+            {"state": "open", "until": time.time() + _BREAKER_OPEN_SECONDS},
+            ttl_seconds=_BREAKER_STATE_TTL,
         )
 
 
@@ -108,22 +255,48 @@ def rapidapi_cached_get(
     """
     Wrapper con:
     - caché normal por cache_key
-    - circuit breaker: si falló hace poco, no spamea RapidAPI por error_ttl_seconds
+    - circuit breaker por host (CLOSED/OPEN/HALF_OPEN): con el host caído falla rápido
+    - caché de error por cache_key: si falló hace poco, no spamea RapidAPI por error_ttl_seconds
+    - caché negativo: 404/422 (ticker inválido/deslistado) y respuestas no-JSON se
+      recuerdan al menos _NEGATIVE_TTL_SECONDS
+    Los TTL de error llevan jitter (±20%) para que los reintentos no se sincronicen.
     """
+    cached = _mem_get(cache_key)
+    if cached is not None:
+        return cached
+
     cached = cache_get(cache_key)
     if cached is not None:
+        _mem_put(cache_key, ttl_seconds, cached)
         return cached
 
     err_key = cache_key + ":err"
     recent_err = cache_get(err_key)
     if recent_err:
         # evita martillar el endpoint cuando está caído / rate-limited
+        if isinstance(recent_err, dict):
+            raise RapidAPIError(str(recent_err.get("err")), status=recent_err.get("http"))
         raise RapidAPIError(str(recent_err))
 
+    if not _breaker_allow():
+        raise RapidAPIError(f"RapidAPI ({RAPIDAPI_HOST}) no disponible: circuit breaker abierto.", status=503)
+
     try:
         data = rapidapi_get(path, params=params)
+        _breaker_success()
         cache_set(cache_key, data, ttl_seconds=ttl_seconds)
+        _mem_put(cache_key, ttl_seconds, data)
         return data
     except RapidAPIError as e:
-        cache_set(err_key, str(e), ttl_seconds=error_ttl_seconds)
+        if _is_config_error(e):
+            pass  # key faltante/inválida: no cuenta para el breaker del host
+        elif _is_transient(e):
+            _breaker_failure()
+        else:
+            _breaker_success()
+        err_ttl = error_ttl_seconds
+        if e.status in _NEGATIVE_STATUSES or (e.status is not None and e.status < 400):
+            err_ttl = max(err_ttl, _NEGATIVE_TTL_SECONDS)
+        err_ttl = max(1, int(err_ttl * random.uniform(0.8, 1.2)))
+        cache_set(err_key, {"err": str(e), "http": e.status}, ttl_seconds=err_ttl)
         raise
@@ -2,14 +2,45 @@
 from __future__ import annotations
 
 import os
+import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except Exception:
+    orjson = None  # type: ignore
+
+from src.services.cache_store import cache_get, cache_get_entry, cache_set
 
 # Rate limit suave (SEC sugiere ~10 req/s máx). Usamos 4-5 req/s.
+# Reloj monotónico + lock: cada caller reserva su turno (_NEXT_TS) de forma atómica,
+# así varios hilos no ven "wait <= 0" a la vez.
 _MIN_INTERVAL_SEC = 0.25
-_last_call_ts = 0.0
+_NEXT_TS = 0.0
+_THROTTLE_LOCK = threading.Lock()
+
+
+# Una sola Session por proceso: keep-alive hacia data.sec.gov / www.sec.gov,
+# el TLS se negocia una vez y el resto de llamadas reutiliza la conexión.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=0)
+_SESSION.mount("https://", _ADAPTER)
+
+
+# orjson parsea directo desde bytes (sin decodificar a str), bastante más rápido
+# que json stdlib en payloads grandes (companyfacts). Ambos lanzan ValueError.
+def _parse_json(r: requests.Response) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(r.content)
+        except orjson.JSONDecodeError:
+            # orjson rechaza NaN/Infinity (JSON no estándar); json de stdlib los acepta
+            pass
+    return r.json()
 
 
 class SecClientError(RuntimeError):
@@ -27,13 +58,26 @@ def _user_agent() -> str:
     )
 
 
+# Headers SEC fijos en la Session (una vez, no en cada request).
+_SESSION.headers.update(
+    {
+        "User-Agent": _user_agent(),
+        "Accept-Encoding": "gzip, deflate",
+        "Accept": "application/json",
+    }
+)
+
+
 def _throttle():
-    global _last_call_ts
-    now = time.time()
-    wait = _MIN_INTERVAL_SEC - (now - _last_call_ts)
+    global _NEXT_TS
+    with _THROTTLE_LOCK:
+        now = time.monotonic()
+        slot = max(now, _NEXT_TS)
+        _NEXT_TS = slot + _MIN_INTERVAL_SEC
+    # se duerme fuera del lock: el turno ya quedó reservado
+    wait = slot - now
     if wait > 0:
         time.sleep(wait)
-    _last_call_ts = time.time()
 
 
 def get_json(url: str, timeout: int = 20) -> Dict[str, Any]:
@@ -41,15 +85,89 @@ def get_json(url: str, timeout: int = 20) -> Dict[str, Any]:
     GET JSON robusto + rate limit + headers SEC.
     """
     _throttle()
-    headers = {
-        "User-Agent": _user_agent(),
-        "Accept-Encoding": "gzip, deflate",
-        "Accept": "application/json",
-    }
     try:
-        r = requests.get(url, headers=headers, timeout=timeout)
+        r = _SESSION.get(url, timeout=timeout)
+        if r.status_code >= 400:
+            raise SecClientError(f"SEC {r.status_code}: {url}")
+        return _parse_json(r)
+    except Exception as e:
+        raise SecClientError(f"SEC request failed: {e}") from e
+
+
+def get_json_conditional(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    timeout: int = 20,
+) -> Optional[Tuple[Dict[str, Any], Optional[str], Optional[str]]]:
+    """
+    GET condicional (If-None-Match / If-Modified-Since).
+    Retorna None si la SEC responde 304 (sin body), si no (data, etag, last_modified).
+    """
+    headers: Dict[str, str] = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    _throttle()
+    try:
+        r = _SESSION.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304:
+            return None
         if r.status_code >= 400:
             raise SecClientError(f"SEC {r.status_code}: {url}")
-        return r.json()
+        return _parse_json(r), r.headers.get("ETag"), r.headers.get("Last-Modified")
+    except SecClientError:
+        raise
     except Exception as e:
         raise SecClientError(f"SEC request failed: {e}") from e
+
+
+# El body se guarda más allá de su TTL lógico para poder revalidarlo con un 304
+# (solo headers) en vez de bajar de nuevo varios MB que no cambiaron.
+_REVALIDATE_WINDOW_SEC = 60 * 60 * 24 * 7
+
+
+def get_json_revalidated(
+    cache_key: str,
+    url: str,
+    ttl_seconds: int,
+    transform: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    force_refresh: bool = False,
+) -> Any:
+    """
+    get_json con caché + revalidación:
+    - body fresco (age <= ttl_seconds) → se sirve sin red
+    - vencido (o force_refresh) → GET condicional con el ETag/Last-Modified guardado
+      en f"{cache_key}:meta"; si es 304 solo se re-sella el body cacheado
+    transform se aplica al JSON descargado antes de cachearlo.
+    """
+    entry = cache_get_entry(cache_key)
+    if entry is not None and not force_refresh and entry["age"] <= ttl_seconds:
+        return entry["value"]
+
+    meta_key = cache_key + ":meta"
+    meta = (cache_get(meta_key) if entry is not None else None) or {}
+    keep = ttl_seconds + _REVALIDATE_WINDOW_SEC
+
+    res = get_json_conditional(url, etag=meta.get("etag"), last_modified=meta.get("last_modified"))
+    if res is None:
+        if entry is not None:
+            cache_set(cache_key, entry["value"], ttl_seconds=keep)
+            # Body y validadores se re-sellan juntos: si meta venciera antes, la
+            # próxima revalidación iría sin ETag y bajaría el body completo.
+            if meta:
+                cache_set(meta_key, meta, ttl_seconds=keep)
+            return entry["value"]
+        # 304 sin body local (meta huérfano): bajar completo
+        res = get_json_conditional(url)
+        if res is None:
+            raise SecClientError(f"SEC 304 sin body cacheado: {url}")
+
+    data, etag, last_modified = res
+    value = transform(data) if transform is not None else data
+    cache_set(cache_key, value, ttl_seconds=keep)
+    if etag or last_modified:
+        cache_set(meta_key, {"etag": etag, "last_modified": last_modified}, ttl_seconds=keep)
+    return value
@@ -1,14 +1,31 @@
 # src/services/sec_data.py
 from __future__ import annotations
 
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
-from src.services.cache_store import cache_get, cache_set
-from src.services.sec_client import get_json
+from src.services.sec_client import get_json_revalidated
 from src.services.sec_ticker_map import ticker_to_cik10
 
 
+# Tags US-GAAP (estándar) que usa get_fundamentals_minimal
+_TAGS = {
+    "assets": "Assets",
+    "liabilities": "Liabilities",
+    "equity": "StockholdersEquity",
+    "revenue": "Revenues",
+    "gross_profit": "GrossProfit",
+    "net_income": "NetIncomeLoss",
+    "operating_cf": "NetCashProvidedByUsedInOperatingActivities",
+    "capex": "PaymentsToAcquirePropertyPlantAndEquipment",
+    "cash": "CashAndCashEquivalentsAtCarryingValue",
+    # Deuda: best effort (no todas reportan igual)
+    "debt": "Debt",
+}
+
+
 # ---------- Helpers ----------
 def _pick_units(concept: dict) -> Optional[List[dict]]:
     """
@@ -78,24 +95,27 @@ def _latest_by_year(arr: List[dict]) -> Dict[int, dict]:
     return best
 
 
-def _series_from_companyfacts(facts: dict, tag: str) -> List[dict]:
+def _series_from_companyfacts(facts: dict, tag: str) -> Tuple[List[dict], Optional[float]]:
     """
-    Retorna lista de registros anuales ordenados: [{"year":YYYY,"end":"YYYY-MM-DD","value":float}]
+    Retorna (rows, last_value):
+      - rows: registros anuales ordenados [{"year":YYYY,"end":"YYYY-MM-DD","value":float}]
+      - last_value: último value no nulo (se arrastra en la misma pasada)
     """
     if not isinstance(facts, dict):
-        return []
+        return [], None
     usgaap = facts.get("facts", {}).get("us-gaap", {})
     concept = usgaap.get(tag)
     if not isinstance(concept, dict):
-        return []
+        return [], None
     arr = _pick_units(concept)
     if not arr:
-        return []
+        return [], None
 
     annual = _annual_facts(arr)
     best = _latest_by_year(annual)
 
     rows: List[dict] = []
+    last: Optional[float] = None
     for y in sorted(best.keys()):
         it = best[y]
         v = it.get("val")
@@ -103,28 +123,45 @@ def _series_from_companyfacts(facts: dict, tag: str) -> List[dict]:
             v = float(v)
         except Exception:
             v = None
+        if v is not None:
+            last = v
         rows.append({"year": y, "end": str(it.get("end")), "value": v})
-    return rows
+    return rows, last
+
+
+def _slim_companyfacts(data: dict) -> dict:
+    """
+    companyfacts completo (5-20 MB en filers grandes, cientos de tags) → solo los
+    tags de _TAGS, con la misma forma {"facts":{"us-gaap":{tag:{...}}}}.
+    """
+    if not isinstance(data, dict):
+        return {}
+    usgaap = (data.get("facts") or {}).get("us-gaap") or {}
+    keep = {tag: usgaap[tag] for tag in _TAGS.values() if tag in usgaap}
+    return {
+        "cik": data.get("cik"),
+        "entityName": data.get("entityName"),
+        "facts": {"us-gaap": keep},
+    }
 
 
 # ---------- Public API ----------
 def get_companyfacts_by_ticker(ticker: str, ttl_seconds: int = 60 * 60 * 24) -> dict:
     """
-    Descarga companyfacts y cachea. TTL recomendado 24h.
+    Descarga companyfacts y cachea solo los tags de _TAGS. TTL recomendado 24h;
+    al vencer se revalida con ETag (304 = no se baja de nuevo).
     """
     cik10 = ticker_to_cik10(ticker)
     if not cik10:
         return {}
 
-    key = f"sec:companyfacts:{cik10}"
-    hit = cache_get(key)
-    if isinstance(hit, dict) and hit:
-        return hit
-
     url = f"https://data.sec.gov/api/xbrl/companyfacts/CIK{cik10}.json"
-    data = get_json(url)
-    cache_set(key, data, ttl_seconds=ttl_seconds)
-    return data
+    return get_json_revalidated(
+        f"sec:companyfacts_slim:{cik10}",
+        url,
+        ttl_seconds=ttl_seconds,
+        transform=_slim_companyfacts,
+    ) or {}
 
 
 def get_fundamentals_minimal(ticker: str) -> dict:
@@ -142,43 +179,33 @@ def get_fundamentals_minimal(ticker: str) -> dict:
     if not facts:
         return {}
 
-    # Tags US-GAAP (estándar)
-    tags = {
-        "assets": "Assets",
-        "liabilities": "Liabilities",
-        "equity": "StockholdersEquity",
-        "revenue": "Revenues",
-        "gross_profit": "GrossProfit",
-        "net_income": "NetIncomeLoss",
-        "operating_cf": "NetCashProvidedByUsedInOperatingActivities",
-        "capex": "PaymentsToAcquirePropertyPlantAndEquipment",
-        "cash": "CashAndCashEquivalentsAtCarryingValue",
-        # Deuda: best effort (no todas reportan igual)
-        "debt": "Debt",
-    }
-
-    series: Dict[str, List[dict]] = {k: _series_from_companyfacts(facts, tag) for k, tag in tags.items()}
+    series: Dict[str, List[dict]] = {}
+    latest: Dict[str, Optional[float]] = {}
+    for k, tag in _TAGS.items():
+        series[k], latest[k] = _series_from_companyfacts(facts, tag)
 
     # Free Cash Flow = OCF + CapEx (CapEx suele ser negativo)
     fcf_rows: List[dict] = []
-    ocf_map = {r["year"]: r for r in series.get("operating_cf", []) if r.get("value") is not None}
-    cap_map = {r["year"]: r for r in series.get("capex", []) if r.get("value") is not None}
-    for y in sorted(set(ocf_map.keys()) & set(cap_map.keys())):
-        ocf = float(ocf_map[y]["value"])
-        cap = float(cap_map[y]["value"])
-        fcf = ocf + cap
-        end = ocf_map[y].get("end") or cap_map[y].get("end")
-        fcf_rows.append({"year": y, "end": end, "value": fcf})
+    last_fcf: Optional[float] = None
+    # Ambas series vienen ordenadas por año (únicos): merge de dos punteros, sin dicts.
+    ocf_rows = series.get("operating_cf") or []
+    cap_rows = series.get("capex") or []
+    i = j = 0
+    while i < len(ocf_rows) and j < len(cap_rows):
+        o, c = ocf_rows[i], cap_rows[j]
+        if o["year"] < c["year"]:
+            i += 1
+        elif o["year"] > c["year"]:
+            j += 1
+        else:
+            if o["value"] is not None and c["value"] is not None:
+                fcf = o["value"] + c["value"]
+                fcf_rows.append({"year": o["year"], "end": o.get("end") or c.get("end"), "value": fcf})
+                last_fcf = fcf
+            i += 1
+            j += 1
     series["free_cf"] = fcf_rows
-
-    # Últimos valores (por año más reciente presente)
-    def _latest_value(key: str) -> Optional[float]:
-        arr = series.get(key) or []
-        for r in reversed(arr):
-            v = r.get("value")
-            if isinstance(v, (int, float)):
-                return float(v)
-        return None
+    latest["free_cf"] = last_fcf
 
     latest_year = None
     # buscamos el último año disponible en revenue o assets
@@ -192,17 +219,48 @@ def get_fundamentals_minimal(ticker: str) -> dict:
         "ticker": (ticker or "").strip().upper(),
         "latest_year": latest_year,
         "series": series,
+        # Últimos valores no nulos (por año más reciente presente)
         "latest": {
-            "assets": _latest_value("assets"),
-            "liabilities": _latest_value("liabilities"),
-            "equity": _latest_value("equity"),
-            "revenue": _latest_value("revenue"),
-            "gross_profit": _latest_value("gross_profit"),
-            "net_income": _latest_value("net_income"),
-            "operating_cf": _latest_value("operating_cf"),
-            "capex": _latest_value("capex"),
-            "free_cf": _latest_value("free_cf"),
-            "cash": _latest_value("cash"),
-            "debt": _latest_value("debt"),
+            k: latest.get(k)
+            for k in (
+                "assets",
+                "liabilities",
+                "equity",
+                "revenue",
+                "gross_profit",
+                "net_income",
+                "operating_cf",
+                "capex",
+                "free_cf",
+                "cash",
+                "debt",
+            )
         },
     }
+
+
+# Pool propio de 8 workers para el fan-out de companyfacts: un lote grande encola en
+# este pool y no ocupa hilos del pool compartido de I/O (HEAD de logos, etc.).
+_SEC_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sec-io")
+atexit.register(_SEC_POOL.shutdown, wait=False)
+
+
+def get_fundamentals_minimal_many(tickers: List[str]) -> Dict[str, dict]:
+    """
+    get_fundamentals_minimal para varios tickers con las descargas solapadas en
+    _SEC_POOL, a lo sumo 8 en vuelo a la vez (la latencia de cada companyfacts se
+    superpone en vez de sumarse).
+    El throttle de sec_client sigue espaciando los requests al rate de la SEC.
+    Un ticker que falla queda como {}.
+    """
+    ts = list(dict.fromkeys((t or "").strip().upper() for t in tickers if t))
+    if not ts:
+        return {}
+
+    def _one(t: str) -> dict:
+        try:
+            return get_fundamentals_minimal(t) or {}
+        except Exception:
+            return {}
+
+    return dict(zip(ts, _SEC_POOL.map(_one, ts)))
@@ -1,52 +1,64 @@
 # src/services/sec_ticker_map.py
 from __future__ import annotations
 
+import random
+from functools import lru_cache
 from typing import Any, Dict, Optional
 
 from src.services.cache_store import cache_get, cache_set
-from src.services.sec_client import get_json
+from src.services.sec_client import get_json_revalidated
 
 # Fuente oficial SEC:
 _TICKER_MAP_URL = "https://www.sec.gov/files/company_tickers.json"
 _CACHE_KEY = "sec:ticker_map:v1"
 _TTL_SECONDS = 60 * 60 * 24 * 30  # 30 días
 
+# Ticker sin CIK (no-SEC, inválido, deslistado): se recuerda el miss para no bajar
+# el mapa completo (~1 MB) en cada búsqueda de ese ticker. Jitter ±20%.
+_MISS_KEY_PREFIX = "sec:cik_miss:"
+_MISS_TTL_SECONDS = 60 * 60 * 6
 
+
+@lru_cache(maxsize=2048)
 def _normalize_ticker(t: str) -> str:
     return (t or "").strip().upper().replace(".", "-")  # BRK.B -> BRK-B
 
 
-def _pad_cik(cik: Any) -> Optional[str]:
-    try:
-        n = int(cik)
-        return f"{n:010d}"
-    except Exception:
-        return None
+def _build_ticker_map(data: Dict[str, Any]) -> Dict[str, str]:
+    # Estructura típica: {"0": {"cik_str": 320193, "ticker": "AAPL", ...}, "1": {...}}
+    # ~12k filas: normalización inline (sin pasar por el lru de _normalize_ticker,
+    # que se llenaría de tickers que nadie busca) y un solo int() por CIK.
+    out: Dict[str, str] = {}
+    if not isinstance(data, dict):
+        return out
+    for row in data.values():
+        if not isinstance(row, dict):
+            continue
+        ticker = row.get("ticker")
+        cik = row.get("cik_str")
+        if not ticker or cik is None:
+            continue
+        try:
+            out[str(ticker).strip().upper().replace(".", "-")] = f"{int(cik):010d}"
+        except (TypeError, ValueError):
+            continue
+    out.pop("", None)
+    return out
 
 
 def get_ticker_map(force_refresh: bool = False) -> Dict[str, str]:
     """
     Retorna dict {TICKER: CIK10}
+    force_refresh revalida contra la SEC (ETag): si el mapa no cambió es un 304.
     """
-    if not force_refresh:
-        hit = cache_get(_CACHE_KEY)
-        if isinstance(hit, dict) and hit:
-            return hit
-
-    data = get_json(_TICKER_MAP_URL)
-    # Estructura típica: {"0": {"cik_str": 320193, "ticker": "AAPL", ...}, "1": {...}}
-    out: Dict[str, str] = {}
-    if isinstance(data, dict):
-        for _, row in data.items():
-            if not isinstance(row, dict):
-                continue
-            ticker = _normalize_ticker(row.get("ticker"))
-            cik10 = _pad_cik(row.get("cik_str"))
-            if ticker and cik10:
-                out[ticker] = cik10
-
-    cache_set(_CACHE_KEY, out, ttl_seconds=_TTL_SECONDS)
-    return out
+    mp = get_json_revalidated(
+        _CACHE_KEY,
+        _TICKER_MAP_URL,
+        ttl_seconds=_TTL_SECONDS,
+        transform=_build_ticker_map,
+        force_refresh=force_refresh,
+    )
+    return mp if isinstance(mp, dict) else {}
 
 
 def ticker_to_cik10(ticker: str) -> Optional[str]:
@@ -56,6 +68,13 @@ def ticker_to_cik10(ticker: str) -> Optional[str]:
     if cik:
         return cik
 
+    miss_key = _MISS_KEY_PREFIX + t
+    if cache_get(miss_key):
+        return None
+
     # Fallback: refresh 1 vez
     mp = get_ticker_map(force_refresh=True)
-    return mp.get(t)
+    cik = mp.get(t)
+    if not cik:
+        cache_set(miss_key, True, ttl_seconds=int(_MISS_TTL_SECONDS * random.uniform(0.8, 1.2)))
+    return cik
@@ -1,9 +1,18 @@
 # src/services/yf_client.py
 from __future__ import annotations
 
+import asyncio
+import logging
+import os
 import time
 import random
+import sqlite3
 import threading
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Optional
+
+from src.services.io_pool import get_io_pool
 
 try:
     import yfinance as yf  # noqa: F401
@@ -24,69 +33,347 @@ class YFError(RuntimeError):
 # -----------------------------
 # GLOBAL THROTTLE (anti-burst)
 # -----------------------------
-_REQ_LOCK = threading.Lock()
-_LAST_REQ_TS = 0.0
-
 # Ajusta si quieres: 0.8–1.2s suele bajar MUCHO rate limits
 MIN_SECONDS_BETWEEN_REQUESTS = 0.9
 
+# Token bucket: tras un rato sin requests se acumulan hasta _BUCKET_CAPACITY tokens
+# (ráfaga inmediata, p.ej. la primera carga de página); en régimen sostenido el
+# rate sigue siendo 1 / MIN_SECONDS_BETWEEN_REQUESTS. Los tokens pueden quedar en
+# negativo = turnos reservados: cada caller descuenta bajo un lock cortísimo y
+# duerme FUERA del lock lo que le toca esperar.
+_BUCKET_CAPACITY = 5.0
+_REFILL_RATE = 1.0 / MIN_SECONDS_BETWEEN_REQUESTS
+_REQ_LOCK = threading.Lock()
+_TOKENS = _BUCKET_CAPACITY
+_LAST_REFILL = time.monotonic()
+
+# Techo para esperas por rate limit (backoff o Retry-After del server)
+RATE_LIMIT_CAP = 60
+
+# Techo de la ventana de backoff por intento (attempt 1, 2, ...), tabulado por clase
+# de error: rate limit 5·2^n (cap RATE_LIMIT_CAP), transitorio 2^n (cap 20).
+# Si max_attempts supera la tabla se repite el último valor.
+_BACKOFF_RL = (5, 10, 20, 40, 60, 60)
+_BACKOFF_TX = (1, 2, 4, 8, 16, 20)
+
+# YF_PROFILE=1: por intento, cuánto fue espera del throttle vs ejecución de fn().
+# Sirve para confirmar que yf_call es I/O-bound (hilos, no procesos) y que fn()
+# nunca corre con _REQ_LOCK tomado (el lock solo cubre la cuenta de tokens).
+_YF_PROFILE = os.getenv("YF_PROFILE") == "1"
+_YF_TIMING = logging.getLogger(__name__ + ".timing")
+
+# Circuit breaker en proceso: tras _BREAKER_THRESHOLD rate-limits seguidos, yf_call
+# falla al instante durante _BREAKER_OPEN_SECONDS (la UI no se congela en backoffs
+# de 60s y Yahoo deja de recibir carga mientras se recupera).
+_BREAKER_THRESHOLD = 3
+_BREAKER_OPEN_SECONDS = 120
+_BREAKER = {"failures": 0, "open_until": 0.0}
+_BREAKER_LOCK = threading.Lock()
+
+# install_http_cache se llama al importar finance_data; Streamlit puede re-importar
+_HTTP_CACHE_INSTALLED = False
+
+
+# TTL por endpoint de Yahoo (globs de requests_cache, URL sin esquema): quotes
+# frescos, chart al ritmo del TTL de precio (5 min), quoteSummary (info,
+# fundamentals, calendario) casi estático. El resto usa expire_seconds.
+_YF_URL_TTLS = {
+    "*/v7/finance/quote": 60,
+    "*/v8/finance/chart": 5 * 60,
+    "*/v10/finance/quoteSummary": 6 * 3600,
+}
+
+
+def _enable_wal(cache_name: str) -> None:
+    """
+    requests_cache viejo (sin wal=): WAL directo sobre el archivo. journal_mode=WAL
+    es persistente en el archivo, así que basta con aplicarlo una vez.
+    """
+    path = cache_name if cache_name.endswith(".sqlite") else cache_name + ".sqlite"
+    try:
+        conn = sqlite3.connect(path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+        finally:
+            conn.close()
+    except Exception:
+        pass
+
 
 def install_http_cache(cache_name: str = "yf_http_cache", expire_seconds: int = 3600) -> None:
     """
     Cachea respuestas HTTP subyacentes de yfinance para reducir llamadas a Yahoo.
+    SQLite en WAL: lecturas concurrentes de los hilos de Streamlit no bloquean las
+    escrituras del caché (y viceversa).
     """
-    if not _HAS_RCACHE:
+    global _HTTP_CACHE_INSTALLED
+    if not _HAS_RCACHE or _HTTP_CACHE_INSTALLED:
         return
+    basic = dict(backend="sqlite", expire_after=expire_seconds)
+    # De más completa a más básica: wal= existe desde requests_cache 1.0 y
+    # urls_expire_after desde 0.8; en cada TypeError se suelta lo que no se entiende.
+    attempts = (
+        dict(basic, wal=True, urls_expire_after={**_YF_URL_TTLS, "*": expire_seconds}),
+        dict(basic, urls_expire_after={**_YF_URL_TTLS, "*": expire_seconds}),
+        basic,
+    )
     try:
-        requests_cache.install_cache(cache_name, expire_after=expire_seconds)
+        for kwargs in attempts:
+            if "wal" not in kwargs:
+                _enable_wal(cache_name)
+            try:
+                requests_cache.install_cache(cache_name, **kwargs)
+            except TypeError:
+                continue
+            _HTTP_CACHE_INSTALLED = True
+            return
     except Exception:
         pass
 
 
+def _throttle() -> None:
+    global _TOKENS, _LAST_REFILL
+    with _REQ_LOCK:
+        now = time.monotonic()
+        _TOKENS = min(_BUCKET_CAPACITY, _TOKENS + (now - _LAST_REFILL) * _REFILL_RATE)
+        _LAST_REFILL = now
+        _TOKENS -= 1.0
+        wait = -_TOKENS / _REFILL_RATE if _TOKENS < 0 else 0.0
+    if wait > 0:
+        time.sleep(wait)
+
+
 def _is_rate_limit_error(exc: Exception) -> bool:
-    # yfinance.exceptions.YFRateLimitError (si existe)
+    # 1) status HTTP real (requests.HTTPError y similares exponen .response)
+    if getattr(getattr(exc, "response", None), "status_code", None) == 429:
+        return True
+    # 2) yfinance.exceptions.YFRateLimitError (si existe)
     if exc.__class__.__name__ == "YFRateLimitError":
         return True
-    msg = str(exc).lower()
-    # heurísticas
+    # 3) heurísticas sobre el mensaje (solo el inicio: no se baja a minúsculas un
+    #    body/traceback entero)
+    msg = str(exc)[:200].lower()
     return ("rate limit" in msg) or ("too many requests" in msg) or ("429" in msg)
 
 
+# Errores que reintentar no arregla: bugs de programación y 4xx "de negocio"
+# (ticker inválido, 404...). TypeError/KeyError/IndexError/AttributeError NO van acá:
+# yfinance los tira cuando Yahoo devuelve un payload vacío o recortado por throttling,
+# y eso sí se arregla reintentando.
+_UNRECOVERABLE = (NameError, NotImplementedError)
+_RETRYABLE_4XX = (408, 425, 429)
+
+
+def _is_recoverable(exc: Exception) -> bool:
+    if _is_rate_limit_error(exc):
+        return True
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in _RETRYABLE_4XX:
+        return False
+    # red, timeouts, 5xx y errores desconocidos de yfinance: se reintentan
+    return not isinstance(exc, _UNRECOVERABLE)
+
+
+def _breaker_open() -> bool:
+    return time.monotonic() < _BREAKER["open_until"]
+
+
+def _breaker_record(rate_limited: bool) -> None:
+    with _BREAKER_LOCK:
+        if not rate_limited:
+            _BREAKER["failures"] = 0
+            return
+        _BREAKER["failures"] += 1
+        if _BREAKER["failures"] >= _BREAKER_THRESHOLD:
+            _BREAKER["open_until"] = time.monotonic() + _BREAKER_OPEN_SECONDS
+            _BREAKER["failures"] = 0
+
+
+def _retry_after_seconds(exc: Exception) -> Optional[float]:
+    """
+    Retry-After de la respuesta HTTP detrás de la excepción (requests.HTTPError y
+    similares exponen .response), en segundos o como HTTP-date. None si no viene.
+    """
+    resp = getattr(exc, "response", None)
+    headers = getattr(resp, "headers", None)
+    if not headers:
+        return None
+    raw = headers.get("Retry-After")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
 def yf_call(fn, max_attempts: int = 6):
     """
     Wrapper de reintentos con:
     - throttle global (evita bursts)
-    - backoff exponencial + jitter
-    - backoff más fuerte si es rate-limit
+    - backoff exponencial con full jitter
+    - backoff más fuerte si es rate-limit (o lo que pida el server vía Retry-After)
+    - fail-fast si el error no es recuperable (bug/parseo, 4xx que no sea 429)
+    - circuit breaker: con Yahoo rate-limitando en serie, falla al instante
     """
-    global _LAST_REQ_TS
     last = None
 
     for attempt in range(1, max_attempts + 1):
-        try:
-            # throttle global
-            with _REQ_LOCK:
-                now = time.time()
-                wait = MIN_SECONDS_BETWEEN_REQUESTS - (now - _LAST_REQ_TS)
-                if wait > 0:
-                    time.sleep(wait)
-                _LAST_REQ_TS = time.time()
+        if _breaker_open():
+            raise YFError("yfinance rate-limited: circuit breaker abierto") from last
 
-            return fn()
+        try:
+            if _YF_PROFILE:
+                t0 = time.perf_counter_ns()
+                _throttle()
+                t1 = time.perf_counter_ns()
+                try:
+                    val = fn()
+                finally:
+                    _YF_TIMING.info(
+                        "yf_call attempt=%d throttle_ms=%.1f fn_ms=%.1f",
+                        attempt,
+                        (t1 - t0) / 1e6,
+                        (time.perf_counter_ns() - t1) / 1e6,
+                    )
+            else:
+                _throttle()
+                val = fn()
+            if _BREAKER["failures"]:
+                _breaker_record(rate_limited=False)
+            return val
 
         except Exception as e:
             last = e
+            if _is_rate_limit_error(e):
+                _breaker_record(rate_limited=True)
+            if not _is_recoverable(e):
+                raise YFError(str(e)) from e
             if attempt == max_attempts:
                 break
 
-            # Backoff normal vs rate limit
-            if _is_rate_limit_error(e):
-                # más agresivo: 5, 10, 20, 40... (cap ~60)
-                base = min(5 * (2 ** (attempt - 1)), 60)
-            else:
-                base = min((2 ** (attempt - 1)), 20)
+            # El server sabe cuánto esperar: ni de más (5-60s ciegos) ni de menos (otro 429)
+            retry_after = _retry_after_seconds(e)
+            if retry_after is not None:
+                time.sleep(min(retry_after, RATE_LIMIT_CAP) + random.uniform(0, 0.3))
+                continue
+
+            # Backoff normal vs rate limit (techo de la ventana)
+            table = _BACKOFF_RL if _is_rate_limit_error(e) else _BACKOFF_TX
+            base = table[min(attempt, len(table)) - 1]
 
-            sleep_s = base + random.uniform(0, 0.6)
-            time.sleep(sleep_s)
+            # Full jitter: uniforme en [0, base] → workers que fallaron juntos no
+            # reintentan juntos (con +0.6s fijo seguían chocando en bloque)
+            time.sleep(random.uniform(0, base))
 
     raise YFError(str(last) if last else "yfinance error")
+
+
+# Dedup de requests en vuelo: dos reruns/widgets que piden lo mismo a la vez comparten
+# una sola llamada (el primero la ejecuta, el resto espera su Future).
+_INFLIGHT: dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def yf_call_dedup(key: str, fn: Callable[[], Any], max_attempts: int = 6) -> Any:
+    """
+    yf_call con single-flight por key (p.ej. f"{symbol}:{method}:{args}").
+    Solo deduplica llamadas concurrentes; no cachea el resultado.
+    """
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        leader = fut is None
+        if leader:
+            fut = Future()
+            _INFLIGHT[key] = fut
+    if not leader:
+        return fut.result()
+
+    try:
+        val = yf_call(fn, max_attempts=max_attempts)
+        fut.set_result(val)
+        return val
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+
+
+def yf_call_many(fns: list[Callable[[], Any]], return_exceptions: bool = False) -> list[Any]:
+    """
+    yf_call para varias llamadas independientes (p.ej. una por ticker) en paralelo
+    sobre el pool compartido de I/O. El throttle global sigue espaciando los
+    requests; lo que se solapa es la latencia de red de cada uno.
+    Resultados en el mismo orden que fns. Con return_exceptions=True, una llamada
+    que falla deja su excepción en la lista en vez de propagarla.
+    """
+    futs = [get_io_pool().submit(yf_call, fn) for fn in fns]
+    out: list[Any] = []
+    for f in futs:
+        try:
+            out.append(f.result())
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            out.append(e)
+    return out
+
+
+def yf_batch_history(symbols: list[str], threads: bool = False, **kwargs) -> dict[str, Any]:
+    """
+    Histórico de varios tickers con un solo yf.download(group_by="ticker") dentro de
+    UN yf_call (un turno del throttle + un set de reintentos para todo el lote).
+    threads=False: yfinance baja los tickers en serie dentro de la llamada, en vez
+    de disparar N requests concurrentes que el throttle global no ve.
+    Retorna {symbol: DataFrame} solo para los símbolos con filas.
+    """
+    syms = list(dict.fromkeys(s for s in symbols if s))
+    if not syms or yf is None:
+        return {}
+
+    kwargs.setdefault("progress", False)
+    df = yf_call(lambda: yf.download(syms, group_by="ticker", threads=threads, **kwargs))
+    if df is None or getattr(df, "empty", True):
+        return {}
+
+    cols = df.columns
+    if getattr(cols, "nlevels", 1) < 2:
+        # yfinance viejo con un solo ticker: columnas planas
+        return {syms[0]: df} if len(syms) == 1 else {}
+
+    present = set(cols.get_level_values(0))
+    out: dict[str, Any] = {}
+    for sym in syms:
+        if sym not in present:
+            continue
+        sub = df[sym].dropna(how="all")
+        if not sub.empty:
+            out[sym] = sub
+    return out
+
+
+async def yf_call_async(fn: Callable[[], Any], max_attempts: int = 6) -> Any:
+    """
+    yf_call para código async: corre en un hilo (asyncio.to_thread) para no bloquear
+    el event loop. yfinance es síncrono, así que comparte el mismo throttle, breaker
+    y reintentos que la versión sync (un solo rate limit para todo el proceso).
+    """
+    return await asyncio.to_thread(yf_call, fn, max_attempts)
+
+
+def yf_gather(fns: list[Callable[[], Any]], return_exceptions: bool = False) -> list[Any]:
+    """
+    Para scripts/CLI sin event loop: corre fns concurrentes vía yf_call_async.
+    (Dentro de Streamlit usar yf_call_many, que no crea un event loop.)
+    """
+
+    async def _run() -> list[Any]:
+        return await asyncio.gather(*(yf_call_async(fn) for fn in fns), return_exceptions=return_exceptions)
+
+    return asyncio.run(_run())
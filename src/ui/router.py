@@ -1,14 +1,18 @@
 import streamlit as st
 from src.db import init_db
 from src.auth import require_login, is_admin
-from src.pages.analysis import page_analysis
 
-# NUEVO: admin page
-from src.pages.admin_users import page_admin_users
+
+# init_db es idempotente pero abre SQLite + PRAGMAs + esquema: una vez por proceso,
+# no en cada rerun de Streamlit.
+@st.cache_resource(show_spinner=False)
+def _init_db_once() -> bool:
+    init_db()
+    return True
 
 
 def run_app():
-    init_db()
+    _init_db_once()
 
     # ⛔ Si no está logueado, require_login dibuja la UI y devolvemos stop
     if not require_login():
@@ -25,7 +29,15 @@ def run_app():
 
         section = st.radio("Secciones", sections, index=0)
 
+    # Las páginas se importan al despacharlas: analysis arrastra finance_data →
+    # yfinance/pandas/numpy (cientos de ms en frío), que ni el login ni el admin usan.
+    # Después del primer import quedan en sys.modules y el import es gratis.
     if section == "Análisis":
+        from src.pages.analysis import page_analysis
+
         page_analysis()
     elif section == "Admin · Usuarios":
+        # NUEVO: admin page
+        from src.pages.admin_users import page_admin_users
+
         page_admin_users()